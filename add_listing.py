@@ -1,8 +1,8 @@
 import json
-with open('next_data.json', 'r', encoding='utf-8') as f:
-    data = json.load(f)
+import payload
+with open('next_data.json', 'rb') as f:
+    apollo = payload.decode_apollo_state(f.read())
 
-apollo = data.get('props', {}).get('pageProps', {}).get('__APOLLO_STATE__', {})
 target_obj = None
 for key, val in apollo.items():
     if val.get('__typename') == 'Listing':
@@ -1,8 +1,9 @@
-import json
-import os
+from analyze import HISTORY_FILE, dataset_version, decode_listing_data, load_json, public_output, write_listing_data
 
-with open("src/listing_data.json", "r", encoding="utf-8") as f:
-    gui_data = json.load(f)
+stored = load_json(HISTORY_FILE)
+# Keep the schema the file was written in; rankings and groups are edited in the v1 shape
+schema_version = stored.get("meta", {}).get("schemaVersion", 1)
+gui_data = decode_listing_data(stored)
 
 # The new listing object
 new_listing = {
@@ -53,14 +54,17 @@ new_listing = {
 # Check if already added
 if not any(obj.get("booliId") == "6178869" for obj in gui_data["objects"]):
     gui_data["objects"].insert(0, new_listing)
-    gui_data["rankings"]["bestDealsByDiff"].append(new_listing)
-    gui_data["rankings"]["bestDealsByDiff"].sort(key=lambda x: x["priceDiff"])
+    best_deals = gui_data["rankings"]["bestDealsByDiff"]
+    best_deals.append(new_listing)
+    best_deals.sort(key=lambda x: x["priceDiff"] if x.get("priceDiff") is not None else float("inf"))
+    groups = gui_data.setdefault("groups", {})
+    groups.setdefault("byArea", {}).setdefault(new_listing["area"], []).append(new_listing)
+    groups.setdefault("byRooms", {}).setdefault(str(new_listing["rooms"]), []).append(new_listing)
+    gui_data["meta"]["objectsAnalyzed"] = len(gui_data["objects"])
+    gui_data["meta"]["datasetVersion"] = dataset_version(gui_data)
 
-    with open("src/listing_data.json", "w", encoding="utf-8") as f:
-        json.dump(gui_data, f, indent=2, ensure_ascii=False)
-
-    with open("public/listing_data.json", "w", encoding="utf-8") as f:
-        json.dump(gui_data, f, indent=2, ensure_ascii=False)
+    write_listing_data("src/listing_data.json", gui_data, schema_version)
+    write_listing_data("public/listing_data.json", public_output(gui_data), schema_version)
 
     print("Listing added to GUI data successfully.")
 else:
@@ -3,10 +3,19 @@ import sys
 import os
 import glob
 import math
+import re
+import gzip
+import hashlib
+import unicodedata
 from datetime import datetime, timedelta
 from collections import defaultdict
 import traceback
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # =====================
 # CONFIG & CONSTANTS
 # =====================
@@ -16,6 +25,25 @@ DEFAULT_INPUT_FILES = [
 SNAPSHOTS_DIR = "snapshots"
 
 GEO_CACHE_FILE = "geo_cache.json"
+HISTORY_FILE = "src/listing_data.json"
+
+# Reuse the previous analyzed record of a listing whose raw data is unchanged ("0" re-analyzes everything)
+ANALYZE_INCREMENTAL = os.getenv("ANALYZE_INCREMENTAL", "1").lower() in ("1", "true", "yes")
+# Raw fields that change from run to run without the listing changing; they are refreshed on every record
+VOLATILE_FIELDS = ("daysActive", "pageViews", "nextShowing")
+# Records analyzed by a different version of this file are never reused
+ANALYZER_VERSION = hashlib.sha256(open(__file__, "rb").read()).hexdigest()[:16]
+
+# listing_data.json schema written by default; --v1 (or LISTING_DATA_SCHEMA=1) writes the old full-object format
+OUTPUT_SCHEMA_VERSION = int(os.getenv("LISTING_DATA_SCHEMA", "2"))
+IMAGE_URL_TEMPLATE = "https://bcdn.se/images/cache/{id}_1170x0.jpg"
+IMAGE_URL_RE = re.compile(r"https://bcdn\.se/images/cache/(\d+)_1170x0\.jpg")
+# Patches from each dataset version to the next; clients holding an old version apply these instead of re-downloading
+PATCHES_DIR = os.getenv("LISTING_PATCHES_DIR", "public/patches")
+PATCHES_KEEP = int(os.getenv("LISTING_PATCHES_KEEP", "14"))
+# With --shards, one content-addressed v2 file per searchSource (plus .gz/.br copies) and a manifest
+SHARDS_DIR = os.getenv("LISTING_SHARDS_DIR", "public/shards")
+SHARDS_MANIFEST = os.getenv("LISTING_SHARDS_MANIFEST", "public/listing_manifest.json")
 
 SWEDISH_DAY_NAMES = ['Måndag', 'Tisdag', 'Onsdag', 'Torsdag', 'Fredag', 'Lördag', 'Söndag']
 SWEDISH_MONTH_NAMES = ['jan', 'feb', 'mar', 'apr', 'maj', 'jun', 'jul', 'aug', 'sep', 'okt', 'nov', 'dec']
@@ -95,6 +123,24 @@ def save_json(filepath, data):
         print(f"Warning: Failed to save {filepath}: {e}", file=sys.stderr)
 
 
+def days_active_at(obj, crawl_date=None):
+    """Days since a raw object was published, as of the crawl date."""
+    # Calculate daysActive from published date if possible
+    published_str = obj.get("published")
+    days_active = obj.get("daysActive")
+    
+    if published_str and crawl_date:
+        try:
+            # Format: "2026-04-01 09:49:10"
+            pub_dt = datetime.strptime(published_str, "%Y-%m-%d %H:%M:%S")
+            # Calculate difference in days
+            diff = crawl_date - pub_dt
+            # Use the calculated value (rounded down, min 0)
+            days_active = max(0, diff.days)
+        except (ValueError, TypeError):
+            pass
+    return days_active
+
 def normalize_object(obj, crawl_date=None):
     """Ensure consistent schema for a single property object."""
     raw_area = obj.get("area") or ""
@@ -110,20 +156,8 @@ def normalize_object(obj, crawl_date=None):
         city = None
 
 
-    # Calculate daysActive from published date if possible
     published_str = obj.get("published")
-    days_active = obj.get("daysActive")
-    
-    if published_str and crawl_date:
-        try:
-            # Format: "2026-04-01 09:49:10"
-            pub_dt = datetime.strptime(published_str, "%Y-%m-%d %H:%M:%S")
-            # Calculate difference in days
-            diff = crawl_date - pub_dt
-            # Use the calculated value (rounded down, min 0)
-            days_active = max(0, diff.days)
-        except (ValueError, TypeError):
-            pass
+    days_active = days_active_at(obj, crawl_date)
 
     return {
         "url": obj.get("url", ""),
@@ -197,7 +231,15 @@ def calculate_metrics(obj, skip_geo=False):
 
     price_diff_percent = ((lp - ev) / ev * 100) if ev and lp is not None else 0
     price_per_sqm = (lp / area) if area else None
-    
+
+    return {
+        "priceDiffPercent": round(price_diff_percent, 2),
+        "pricePerSqm": round(price_per_sqm, 2) if price_per_sqm else None,
+        **time_metrics(obj)
+    }
+
+def time_metrics(obj):
+    """Metrics of a normalized object that change with its age and page views."""
     # Calculate 'isNew' (max 7 days)
     is_new = False
     
@@ -221,13 +263,300 @@ def calculate_metrics(obj, skip_geo=False):
     has_viewing = bool(obj.get("nextShowing"))
 
     return {
-        "priceDiffPercent": round(price_diff_percent, 2),
-        "pricePerSqm": round(price_per_sqm, 2) if price_per_sqm else None,
         "isRecentlyPublished": is_new,
         "hasViewing": has_viewing,
         "pageViewsPerDay": views_per_day
     }
 
+def raw_fingerprint(obj):
+    """Hash of a merged raw object, ignoring VOLATILE_FIELDS."""
+    stable = {k: v for k, v in obj.items() if k not in VOLATILE_FIELDS}
+    encoded = json.dumps(stable, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:20]
+
+def previous_records(hist_data):
+    """Analyzed records of the previous run by URL, with the raw fingerprints they were built from."""
+    meta = hist_data.get("meta", {})
+    if meta.get("analyzerVersion") != ANALYZER_VERSION:
+        return {}, {}
+    records = {o["url"]: o for o in hist_data.get("objects", []) if o.get("url")}
+    return records, meta.get("fingerprints") or {}
+
+def refresh_record(record, obj, crawl_date=None):
+    """A copy of a reused record with its volatile fields recomputed from its raw object."""
+    record = dict(record)
+    record["pageViews"] = obj.get("pageViews", 0)
+    record["nextShowing"] = resolve_showing_date(obj.get("nextShowing"), crawl_date)
+    record["daysActive"] = days_active_at(obj, crawl_date)
+    # Records without prices carry placeholder metrics, which never change
+    if "isRecentlyPublished" in record:
+        record.update(time_metrics(record))
+    return record
+
+# =====================
+# OUTPUT FORMAT
+# =====================
+# v1 repeats full objects in rankings and groups. v2 stores each object once,
+# rankings and groups hold indices into "objects", and Booli CDN images are
+# stored as their ids, expanded with meta.imageUrlTemplate.
+def image_id(url):
+    match = IMAGE_URL_RE.fullmatch(url) if isinstance(url, str) else None
+    return match.group(1) if match else url
+
+def image_url(value):
+    return IMAGE_URL_TEMPLATE.format(id=value) if isinstance(value, str) and value.isdigit() else value
+
+def encode_output_v2(output):
+    """The v2 form of an analyzer result (which is left unchanged)."""
+    index = {id(obj): i for i, obj in enumerate(output["objects"])}
+    # A v1 file read back from disk holds copies in its rankings and groups; match those by URL
+    url_index = {obj.get("url"): i for i, obj in enumerate(output["objects"])}
+    def refs(items):
+        return [index[id(obj)] if id(obj) in index else url_index[obj.get("url")] for obj in items]
+
+    objects = []
+    for obj in output["objects"]:
+        obj = dict(obj)
+        obj["imageUrl"] = image_id(obj.get("imageUrl"))
+        obj["images"] = [image_id(u) for u in obj.get("images") or []]
+        objects.append(obj)
+
+    return {
+        **output,
+        "meta": {**output["meta"], "schemaVersion": 2, "imageUrlTemplate": IMAGE_URL_TEMPLATE},
+        "objects": objects,
+        "rankings": {name: refs(items) for name, items in output["rankings"].items()},
+        "groups": {name: {key: refs(items) for key, items in group.items()} for name, group in output["groups"].items()},
+    }
+
+def decode_listing_data(data):
+    """A loaded listing_data.json in the v1 shape, whichever schema it was written in."""
+    if not data or data.get("meta", {}).get("schemaVersion") != 2:
+        return data
+    objects = data.get("objects", [])
+    for obj in objects:
+        obj["imageUrl"] = image_url(obj.get("imageUrl"))
+        obj["images"] = [image_url(v) for v in obj.get("images") or []]
+    def deref(items):
+        return [objects[i] for i in items]
+
+    return {
+        **data,
+        "rankings": {name: deref(items) for name, items in data.get("rankings", {}).items()},
+        "groups": {name: {key: deref(items) for key, items in group.items()} for name, group in data.get("groups", {}).items()},
+    }
+
+# Run bookkeeping that only the next analyzer run reads; kept in src/ and out of public/
+PRIVATE_META_FIELDS = ("fingerprints",)
+
+def public_output(output):
+    """An analyzer result without the meta fields clients have no use for."""
+    return {**output, "meta": {k: v for k, v in output["meta"].items() if k not in PRIVATE_META_FIELDS}}
+
+def write_listing_data(path, output, schema_version=OUTPUT_SCHEMA_VERSION):
+    """Write an analyzer result as listing_data.json in the given schema."""
+    with open(path, "w", encoding="utf-8") as f:
+        if schema_version == 1:
+            # A decoded v2 document still carries the v2 markers in its meta
+            meta = {k: v for k, v in output["meta"].items() if k not in ("schemaVersion", "imageUrlTemplate")}
+            json.dump({**output, "meta": meta}, f, indent=2, ensure_ascii=False)
+        else:
+            json.dump(encode_output_v2(output), f, separators=(",", ":"), ensure_ascii=False)
+
+# =====================
+# PATCHES
+# =====================
+# meta.datasetVersion hashes a dataset's v2 objects, rankings and groups. A
+# patch turns version "from" into version "to": "objects" lists the new
+# objects in order, each either the index of the same listing (by URL) in the
+# old dataset or a full added record; "changed" holds field-level diffs
+# by new index; "removed" lists URLs that are gone. Rankings, groups, changes
+# and meta (without the analyzer's fingerprints) are carried over whole.
+def dataset_version(output):
+    """Content hash of an analyzer result, independent of its meta."""
+    encoded = encode_output_v2(output)
+    body = {key: encoded[key] for key in ("objects", "rankings", "groups")}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def make_patch(previous, output):
+    """The patch from the previous analyzer result to the new one (both in the v1 shape)."""
+    old_objects = encode_output_v2(previous)["objects"]
+    new = encode_output_v2(output)
+    old_index = {o.get("url"): i for i, o in enumerate(old_objects)}
+
+    objects, changed = [], {}
+    for i, obj in enumerate(new["objects"]):
+        j = old_index.get(obj.get("url"))
+        if j is None:
+            objects.append(obj)
+            continue
+        objects.append(j)
+        old = old_objects[j]
+        diff = {}
+        set_fields = {k: v for k, v in obj.items() if k not in old or old[k] != v}
+        unset_fields = [k for k in old if k not in obj]
+        if set_fields:
+            diff["set"] = set_fields
+        if unset_fields:
+            diff["unset"] = unset_fields
+        if diff:
+            changed[str(i)] = diff
+
+    new_urls = {o.get("url") for o in new["objects"]}
+    return {
+        "schemaVersion": 2,
+        "from": previous["meta"].get("datasetVersion") or dataset_version(previous),
+        "to": output["meta"]["datasetVersion"],
+        "meta": public_output(new)["meta"],
+        "objects": objects,
+        "changed": changed,
+        "removed": [o.get("url") for o in old_objects if o.get("url") not in new_urls],
+        "rankings": new["rankings"],
+        "groups": new["groups"],
+        "changes": new["changes"],
+    }
+
+def apply_patch(data, patch):
+    """Apply a patch to a v2 listing_data.json document and return the new document."""
+    old_objects = data["objects"]
+    objects = []
+    for i, entry in enumerate(patch["objects"]):
+        obj = dict(old_objects[entry]) if isinstance(entry, int) else entry
+        diff = patch["changed"].get(str(i))
+        if diff:
+            obj.update(diff.get("set", {}))
+            for field in diff.get("unset", []):
+                obj.pop(field, None)
+        objects.append(obj)
+    return {
+        "meta": patch["meta"],
+        "objects": objects,
+        "rankings": patch["rankings"],
+        "groups": patch["groups"],
+        "changes": patch["changes"],
+        "errors": data.get("errors", []),
+    }
+
+def write_patch(previous, output, patches_dir=PATCHES_DIR, keep=PATCHES_KEEP):
+    """Add the patch from `previous` to `output` to the patch index, keeping the newest `keep`."""
+    # Created even when there is nothing to write, so the folder can always be committed
+    os.makedirs(patches_dir, exist_ok=True)
+    patch = make_patch(previous, output)
+    if patch["from"] == patch["to"]:
+        return None
+    filename = f"{patch['from']}-{patch['to']}.json"
+    body = json.dumps(patch, separators=(",", ":"), ensure_ascii=False)
+    with open(os.path.join(patches_dir, filename), "w", encoding="utf-8") as f:
+        f.write(body)
+
+    index_path = os.path.join(patches_dir, "index.json")
+    index = load_json(index_path) or {"patches": []}
+    patches = [p for p in index["patches"] if p["path"] != filename]
+    patches.append({
+        "from": patch["from"],
+        "to": patch["to"],
+        "path": filename,
+        "bytes": len(body.encode("utf-8")),
+        "generatedAt": patch["meta"].get("generatedAt"),
+    })
+    kept = patches[-keep:] if keep > 0 else []
+    for dropped in patches[:len(patches) - len(kept)]:
+        try:
+            os.remove(os.path.join(patches_dir, dropped["path"]))
+        except FileNotFoundError:
+            pass
+
+    temp_path = index_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"latest": patch["to"], "patches": kept}, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, index_path)
+    return patch
+
+# =====================
+# SHARDS
+# =====================
+# Each shard holds the listings of one searchSource in the v2 format. Its file
+# name carries its content hash, so an unchanged shard keeps its URL and can be
+# cached forever; only the small manifest has to be fetched on every load.
+def shard_slug(source):
+    ascii_name = unicodedata.normalize("NFKD", source).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", ascii_name.lower()).strip("-") or "other"
+
+def shard_output(output, source):
+    """The part of an analyzer result belonging to one searchSource."""
+    objects = [o for o in output["objects"] if o.get("searchSource") == source]
+    members = {id(o) for o in objects}
+    def keep(items):
+        return [o for o in items if id(o) in members]
+
+    groups = {}
+    for name, group in output["groups"].items():
+        kept = {key: keep(items) for key, items in group.items()}
+        groups[name] = {key: items for key, items in kept.items() if items}
+    return {
+        # Nothing run-specific here, so the bytes only change when the listings do
+        "meta": {"searchSource": source},
+        "objects": objects,
+        "rankings": {name: keep(items) for name, items in output["rankings"].items()},
+        "groups": groups,
+    }
+
+def write_precompressed(path, body):
+    """Write `body` to path, path.gz and (with brotli installed) path.br; returns their sizes."""
+    sizes = {"bytes": len(body)}
+    variants = [(path, body), (path + ".gz", gzip.compress(body, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((path + ".br", brotli.compress(body, quality=11)))
+    for variant_path, data in variants:
+        with open(variant_path, "wb") as f:
+            f.write(data)
+    sizes["gzipBytes"] = len(variants[1][1])
+    sizes["brotliBytes"] = len(variants[2][1]) if brotli is not None else None
+    return sizes
+
+def write_shards(output, shards_dir=SHARDS_DIR, manifest_path=SHARDS_MANIFEST):
+    """Write one shard per searchSource and the manifest listing them; returns the manifest."""
+    os.makedirs(shards_dir, exist_ok=True)
+    if brotli is None:
+        print("Warning: brotli is not installed; writing shards without .br copies.", file=sys.stderr)
+
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    sources = sorted({o.get("searchSource") or "" for o in output["objects"]})
+    shards = []
+    written = set()
+    for source in sources:
+        shard = encode_output_v2(shard_output(output, source))
+        body = json.dumps(shard, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        content_hash = hashlib.sha256(body).hexdigest()[:16]
+        filename = f"{shard_slug(source)}.{content_hash}.json"
+        path = os.path.join(shards_dir, filename)
+        written.update({filename, filename + ".gz", filename + ".br"})
+        shards.append({
+            "searchSource": source,
+            "path": os.path.relpath(os.path.abspath(path), manifest_dir).replace(os.sep, "/"),
+            "hash": content_hash,
+            "count": len(shard["objects"]),
+            **write_precompressed(path, body),
+        })
+
+    manifest = {
+        "schemaVersion": 2,
+        "generatedAt": output["meta"].get("generatedAt"),
+        "crawledAt": output["meta"].get("crawledAt"),
+        "imageUrlTemplate": IMAGE_URL_TEMPLATE,
+        "shards": shards,
+    }
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+
+    # Shards the manifest no longer lists
+    for old_file in os.listdir(shards_dir):
+        if old_file not in written and re.fullmatch(r"[a-z0-9-]+\.[0-9a-f]{16}\.json(\.gz|\.br)?", old_file):
+            os.remove(os.path.join(shards_dir, old_file))
+    return manifest
+
 def get_latest_historical_snapshot(current_file_path):
     """Return the path to the previous successful data file."""
     # We now use src/listing_data.json as the single source of truth for "previous state"
@@ -276,8 +605,8 @@ def run():
         snapshot_files = glob.glob(os.path.join(SNAPSHOTS_DIR, "*.json"))
         input_files.extend(snapshot_files)
 
-    if len(sys.argv) > 1:
-        raw_args = sys.argv[1:]
+    raw_args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if raw_args:
         input_files = []
         for arg in raw_args:
             if "*" in arg or "?" in arg:
@@ -335,21 +664,21 @@ def run():
         raw_objects.extend(objs)
 
     # 1.3 ALSO include objects from the current src/listing_data.json that aren't in the new crawl
-    hist_file = "src/listing_data.json"
-    if os.path.exists(hist_file):
-        hist_data = load_json(hist_file)
-        if hist_data:
-            # Update max_crawled_at if the history file is newer
-            hist_crawled_at = hist_data.get("meta", {}).get("crawledAt")
-            if hist_crawled_at:
-                if not max_crawled_at or hist_crawled_at > max_crawled_at:
-                    max_crawled_at = hist_crawled_at
-
-            if "objects" in hist_data:
-                current_urls = {o.get("url") for o in raw_objects if o.get("url")}
-                # User requested to only show active search items. Do not merge old items.
-                added_count = 0
-                print(f"Ignored historical objects not found in current crawl (showing only active).")
+    # Loaded once; also the previous records for incremental analysis and change detection
+    hist_file = HISTORY_FILE
+    hist_data = decode_listing_data(load_json(hist_file))
+    if hist_data:
+        # Update max_crawled_at if the history file is newer
+        hist_crawled_at = hist_data.get("meta", {}).get("crawledAt")
+        if hist_crawled_at:
+            if not max_crawled_at or hist_crawled_at > max_crawled_at:
+                max_crawled_at = hist_crawled_at
+
+        if "objects" in hist_data:
+            current_urls = {o.get("url") for o in raw_objects if o.get("url")}
+            # User requested to only show active search items. Do not merge old items.
+            added_count = 0
+            print(f"Ignored historical objects not found in current crawl (showing only active).")
 
     if max_crawled_at:
         crawled_at = max_crawled_at
@@ -408,20 +737,33 @@ def run():
     # Load Cache
     geo_cache = load_json(GEO_CACHE_FILE) or {}
     
+    # Parse crawled_at to datetime for resolve_showing_date
+    crawl_dt = None
+    if crawled_at:
+        try:
+            dt = datetime.fromisoformat(crawled_at.replace('Z', '+00:00'))
+            # Convert to Swedish local time (approx +2h for CEST)
+            # Booli operates in Swedish time, so "Idag" at 01:00 AM means the new day.
+            crawl_dt = (dt + timedelta(hours=2)).replace(tzinfo=None)
+        except (ValueError, TypeError):
+            pass
+
+    # Unchanged listings keep last run's record with only the volatile fields refreshed
+    prev_records, prev_fingerprints = previous_records(hist_data) if ANALYZE_INCREMENTAL and hist_data else ({}, {})
+    fingerprints = {}
+    reused = 0
+
     try:
         # 2. Normalize & Enrich
         analyzed_objects = []
         for i, obj in enumerate(raw_objects):
-            # Parse crawled_at to datetime for resolve_showing_date
-            crawl_dt = None
-            if crawled_at:
-                try:
-                    dt = datetime.fromisoformat(crawled_at.replace('Z', '+00:00'))
-                    # Convert to Swedish local time (approx +2h for CEST)
-                    # Booli operates in Swedish time, so "Idag" at 01:00 AM means the new day.
-                    crawl_dt = (dt + timedelta(hours=2)).replace(tzinfo=None)
-                except (ValueError, TypeError):
-                    pass
+            url = obj["url"]
+            fingerprints[url] = raw_fingerprint(obj)
+            if url in prev_records and prev_fingerprints.get(url) == fingerprints[url]:
+                analyzed_objects.append(refresh_record(prev_records[url], obj, crawl_dt))
+                reused += 1
+                continue
+
             norm = normalize_object(obj, crawl_dt)
             
             lat = norm.get("latitude")
@@ -475,6 +817,9 @@ def run():
     finally:
         # Always save cache, even if we crash mid-loop
         save_json(GEO_CACHE_FILE, geo_cache)
+
+    if prev_records:
+        print(f"Reused {reused} of {len(analyzed_objects)} analyzed records; re-analyzed {len(analyzed_objects) - reused} changed listings.")
         
     # 3. Aggregations
     
@@ -498,12 +843,8 @@ def run():
     # 4. Change Detection
     changes = []
     # Always check against src/data.json for changes
-    hist_file = "src/listing_data.json"
-    
-    if os.path.exists(hist_file):
-        hist_data = load_json(hist_file)
-        if hist_data:
-            changes = detect_changes(raw_objects, hist_data.get("objects", []))
+    if hist_data:
+        changes = detect_changes(raw_objects, hist_data.get("objects", []))
             
     # 5. Output
     output = {
@@ -511,7 +852,10 @@ def run():
             "generatedAt": datetime.utcnow().isoformat(),
             "crawledAt": crawled_at,
             "inputFiles": loaded_files,
-            "objectsAnalyzed": len(analyzed_objects)
+            "objectsAnalyzed": len(analyzed_objects),
+            "analyzerVersion": ANALYZER_VERSION,
+            # Raw-object fingerprints by URL, read back by the next incremental run
+            "fingerprints": fingerprints
         },
         "objects": analyzed_objects,
         "rankings": {
@@ -524,6 +868,7 @@ def run():
         "changes": changes,
         "errors": []
     }
+    output["meta"]["datasetVersion"] = dataset_version(output)
     
     return output
 
@@ -532,15 +877,26 @@ if __name__ == "__main__":
         result = run()
         print(json.dumps(result, indent=2, ensure_ascii=False))
         
+        schema_version = 1 if "--v1" in sys.argv[1:] else OUTPUT_SCHEMA_VERSION
         try:
+            # The dataset clients hold now, read before it is overwritten
+            previous = decode_listing_data(load_json(HISTORY_FILE))
+            if previous.get("objects"):
+                patch = write_patch(previous, result)
+                if patch:
+                    print(f"Wrote patch {patch['from']} -> {patch['to']}: {sum(not isinstance(o, int) for o in patch['objects'])} added, "
+                          f"{len(patch['changed'])} changed, {len(patch['removed'])} removed", file=sys.stderr)
+
             os.makedirs("src", exist_ok=True)
-            with open("src/listing_data.json", "w", encoding="utf-8") as f:
-                json.dump(result, f, indent=2, ensure_ascii=False)
+            write_listing_data("src/listing_data.json", result, schema_version)
             
             # Also save to public for local development fetching
             os.makedirs("public", exist_ok=True)
-            with open("public/listing_data.json", "w", encoding="utf-8") as f:
-                json.dump(result, f, indent=2, ensure_ascii=False)
+            write_listing_data("public/listing_data.json", public_output(result), schema_version)
+
+            if "--shards" in sys.argv[1:]:
+                manifest = write_shards(result)
+                print(f"Wrote {len(manifest['shards'])} shards to {SHARDS_DIR} and {SHARDS_MANIFEST}", file=sys.stderr)
         except Exception as e:
             print(f"Warning: Could not write to data paths: {e}", file=sys.stderr)
             
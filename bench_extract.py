@@ -0,0 +1,107 @@
+"""Benchmark extract_objects on pages rebuilt from the recorded __NEXT_DATA__ files.
+
+next_data.json and result_244663.json are detail pages. Each one is turned into
+a synthetic search page with LISTINGS copies of its listing plus a detail page,
+so the regex fallbacks and tag matching run as they do on a real crawl.
+
+Usage: python bench_extract.py [--listings 40] [--repeat 5]
+"""
+import argparse
+import copy
+import html
+import json
+import time
+
+import scraper
+
+RECORDED = ["next_data.json", "result_244663.json"]
+AREA_ID = "874689"
+
+def listing_key(apollo):
+    return next(k for k in apollo if k.startswith(("Listing:", "SoldProperty:", "Project:")))
+
+def strings(value):
+    """All string leaves of a JSON value, used as the visible text of a listing card."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from strings(v)
+
+def build_page(next_data, apollo, keys):
+    cards = []
+    for key in keys:
+        text = " ".join(s for s in strings(scraper.resolve(apollo[key], apollo)) if not s.startswith("http"))
+        cards.append(f"<article><p>{html.escape(text)}</p></article>")
+    payload = json.dumps(next_data, ensure_ascii=False).replace("</", "<\\/")
+    return (
+        f'<html><head><title>Booli</title></head><body><div id="__next">{"".join(cards)}</div>'
+        f'<script id="__NEXT_DATA__" type="application/json">{payload}</script></body></html>'
+    )
+
+def search_page(path, listings):
+    """A search page for AREA_ID holding `listings` copies of the recorded listing."""
+    next_data = json.load(open(path, encoding="utf-8"))
+    apollo = next_data["props"]["pageProps"]["__APOLLO_STATE__"]
+    key = listing_key(apollo)
+    template = apollo.pop(key)
+    keys = []
+    for i in range(listings):
+        listing = copy.deepcopy(template)
+        listing["booliId"] = f"{i + 1}"
+        listing["url"] = f"/bostad/{i + 1}"
+        apollo[f"Listing:{i + 1}"] = listing
+        keys.append(f"Listing:{i + 1}")
+    apollo["ROOT_QUERY"][f'searchForSale({{"input":{{"areaId":"{AREA_ID}","page":1}}}})'] = {
+        "__typename": "SearchResult",
+        "result": [{"__ref": k} for k in keys],
+        "totalCount": listings,
+    }
+    return build_page(next_data, apollo, keys), f"https://www.booli.se/sok/till-salu?areaIds={AREA_ID}"
+
+def detail_page(path):
+    """The recorded detail page, served as the single result of its own search."""
+    next_data = json.load(open(path, encoding="utf-8"))
+    apollo = next_data["props"]["pageProps"]["__APOLLO_STATE__"]
+    key = listing_key(apollo)
+    apollo["ROOT_QUERY"]["searchForSale({})"] = {"__typename": "SearchResult", "result": [{"__ref": key}]}
+    return build_page(next_data, apollo, [key]), f"https://www.booli.se/bostad/{apollo[key].get('booliId', 0)}"
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=40, help="Listings per synthetic search page")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per page; the best time is reported")
+    args = parser.parse_args()
+
+    # Count and time the full-page text parses done by extract_objects
+    parses = [0, 0.0]
+    page_text = scraper.page_text
+    def counting_page_text(page):
+        start = time.perf_counter()
+        parses[0] += 1
+        text = page_text(page)
+        parses[1] += time.perf_counter() - start
+        return text
+    scraper.page_text = counting_page_text
+
+    print(f"HTML parser: {getattr(scraper, 'HTML_PARSER', 'html.parser')}")
+    for path in RECORDED:
+        for label, (page, source) in [("search", search_page(path, args.listings)), ("detail", detail_page(path))]:
+            parses[:] = [0, 0.0]
+            seconds, objects = timed(lambda: scraper.extract_objects(page, source), args.repeat)
+            print(
+                f"{path:20} {label:6} {len(page) / 1024:7.0f} KB  {len(objects):3} objects  "
+                f"{parses[0] // args.repeat:4} parses  {parses[1] * 1000 / args.repeat:7.1f} ms parsing  "
+                f"{seconds * 1000:8.1f} ms/page"
+            )
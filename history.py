@@ -0,0 +1,144 @@
+"""Append-only history of every listing the crawler has observed.
+
+One SQLite file holds an observation per listing and crawl date, written only
+when something tracked (list price, estimate, page views or status) differs
+from the listing's latest observation, so the store grows with changes rather
+than with daily copies of the snapshot. Observations of earlier days are never
+updated or deleted.
+
+Usage:
+    python history.py price <booliId>      price history of one listing
+    python history.py since <YYYY-MM-DD>   everything that changed since a date
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    booli_id TEXT PRIMARY KEY,
+    url TEXT,
+    address TEXT,
+    search_source TEXT,
+    first_seen TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS observations (
+    booli_id TEXT NOT NULL,
+    observed_on TEXT NOT NULL,
+    list_price INTEGER,
+    estimated_value INTEGER,
+    page_views INTEGER,
+    status TEXT NOT NULL,
+    PRIMARY KEY (booli_id, observed_on)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS observations_by_date ON observations (observed_on, booli_id);
+"""
+TRACKED = ("list_price", "estimated_value", "page_views", "status")
+# Lives in the repository and is committed after each crawl; unlike the page cache it must never be lost
+DEFAULT_PATH = os.getenv("HISTORY_DB_PATH", "listing_history.sqlite")
+
+def connect(path: str) -> sqlite3.Connection:
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+def latest_observations(db: sqlite3.Connection) -> dict:
+    """The newest observation of every listing, by booliId."""
+    rows = db.execute(
+        """SELECT o.*, l.search_source FROM observations o
+           JOIN (SELECT booli_id, MAX(observed_on) AS observed_on FROM observations GROUP BY booli_id) latest
+             USING (booli_id, observed_on)
+           JOIN listings l USING (booli_id)"""
+    ).fetchall()
+    return {row["booli_id"]: row for row in rows}
+
+def record_snapshot(path: str, objects, crawled_on: str, complete_sources=None) -> dict:
+    """Record a crawl's objects as of `crawled_on` (YYYY-MM-DD).
+
+    Listings last seen active under one of `complete_sources`, but missing
+    from the crawl, are recorded as removed. Those are the searchSources whose
+    pages were all fetched; by default every searchSource among `objects`.
+    """
+    db = connect(path)
+    try:
+        latest = latest_observations(db)
+        seen, rows = set(), []
+        for obj in objects:
+            booli_id = obj.get("booliId")
+            if booli_id is None:
+                continue
+            booli_id = str(booli_id)
+            seen.add(booli_id)
+            db.execute(
+                "INSERT OR IGNORE INTO listings VALUES (?, ?, ?, ?, ?)",
+                (booli_id, obj.get("url"), obj.get("address"), obj.get("searchSource"), crawled_on),
+            )
+            rows.append((
+                booli_id,
+                obj.get("listPrice"),
+                obj.get("estimatedValue"),
+                obj.get("pageViews"),
+                "sold" if obj.get("isSold") else "active",
+            ))
+
+        sources = set(complete_sources) if complete_sources is not None else {obj.get("searchSource") for obj in objects}
+        for booli_id, row in latest.items():
+            if booli_id not in seen and row["status"] != "removed" and row["search_source"] in sources:
+                rows.append((booli_id, row["list_price"], row["estimated_value"], row["page_views"], "removed"))
+
+        written = 0
+        for booli_id, *values in rows:
+            previous = latest.get(booli_id)
+            if previous is not None and tuple(previous[k] for k in TRACKED) == tuple(values):
+                continue
+            # A second crawl on the same day replaces that day's observation
+            db.execute("INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?)", (booli_id, crawled_on, *values))
+            written += 1
+        db.commit()
+        return {"observed": len(seen), "written": written}
+    finally:
+        db.close()
+
+def price_history(path: str, booli_id) -> list:
+    """Every recorded observation of one listing, oldest first."""
+    db = connect(path)
+    try:
+        rows = db.execute(
+            "SELECT * FROM observations WHERE booli_id = ? ORDER BY observed_on", (str(booli_id),)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        db.close()
+
+def changes_since(path: str, since: str) -> list:
+    """Observations recorded on or after `since` (YYYY-MM-DD), with the listing's URL and address."""
+    db = connect(path)
+    try:
+        rows = db.execute(
+            """SELECT o.*, l.url, l.address FROM observations o JOIN listings l USING (booli_id)
+               WHERE o.observed_on >= ? ORDER BY o.observed_on, o.booli_id""",
+            (since,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_PATH, help="History database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("price", help="Price history of one listing").add_argument("booli_id")
+    subparsers.add_parser("since", help="Changes recorded since a date").add_argument("date")
+    args = parser.parse_args()
+
+    if args.command == "price":
+        result = price_history(args.db, args.booli_id)
+    else:
+        result = changes_since(args.db, args.date)
+    json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+    print()
@@ -0,0 +1,128 @@
+"""Locate and decode the Next.js __NEXT_DATA__ payload of a Booli page.
+
+The script is found with plain substring search instead of a regex, and the JSON
+is decoded with orjson or msgspec when one of them is installed (stdlib json
+otherwise). decode_apollo_state() decodes only the Apollo cache, which is all
+the extractors read.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+SCRIPT_OPEN = '<script id="__NEXT_DATA__"'
+SCRIPT_CLOSE = "</script>"
+APOLLO_KEY = '"__APOLLO_STATE__"'
+
+if msgspec is not None:
+    # Only these fields are materialized; everything else in the document is skipped
+    class _PageProps(msgspec.Struct):
+        apollo: dict = msgspec.field(default_factory=dict, name="__APOLLO_STATE__")
+        apollo_alt: dict = msgspec.field(default_factory=dict, name="apolloState")
+
+    class _Props(msgspec.Struct):
+        page_props: _PageProps = msgspec.field(default_factory=_PageProps, name="pageProps")
+        apollo: dict = msgspec.field(default_factory=dict, name="__APOLLO_STATE__")
+
+    class _NextData(msgspec.Struct):
+        props: _Props = msgspec.field(default_factory=_Props)
+
+    _apollo_decoder = msgspec.json.Decoder(_NextData)
+
+def backend() -> str:
+    """Name of the JSON decoder in use."""
+    if orjson is not None:
+        return "orjson"
+    if msgspec is not None:
+        return "msgspec"
+    return "json"
+
+def loads(data):
+    """Decode a JSON document given as str or bytes; malformed input raises ValueError."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if msgspec is not None:
+        try:
+            return msgspec.json.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+    return json.loads(data)
+
+def next_data_json(html: str):
+    """The raw JSON text of the __NEXT_DATA__ script of a page, or None if it has none."""
+    start = html.find(SCRIPT_OPEN)
+    if start == -1:
+        return None
+    start = html.find(">", start + len(SCRIPT_OPEN))
+    if start == -1:
+        return None
+    end = html.find(SCRIPT_CLOSE, start)
+    if end == -1:
+        return None
+    return html[start + 1:end]
+
+def apollo_state(next_data: dict) -> dict:
+    """The Apollo cache of a decoded __NEXT_DATA__ document."""
+    page_props = next_data.get("props", {}).get("pageProps", {})
+    apollo = page_props.get("__APOLLO_STATE__", {})
+
+    if not apollo:
+        # Try alternative location
+        apollo = page_props.get("apolloState", {})
+    if not apollo:
+        # Try top-level props
+        apollo = next_data.get("props", {}).get("__APOLLO_STATE__", {})
+    return apollo
+
+def decode_apollo_state(document) -> dict:
+    """Decode only the Apollo cache of a __NEXT_DATA__ JSON document (str or bytes)."""
+    if msgspec is not None:
+        try:
+            next_data = _apollo_decoder.decode(document)
+        except msgspec.ValidationError:
+            # Unexpected shape (e.g. a null Apollo state); take the generic path
+            return apollo_state(loads(document))
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+        props = next_data.props
+        return props.page_props.apollo or props.page_props.apollo_alt or props.apollo
+
+    if orjson is None:
+        # stdlib: when the Apollo key is unambiguous, decode just the value behind it
+        if isinstance(document, bytes):
+            document = document.decode("utf-8")
+        key = document.find(APOLLO_KEY)
+        if key != -1 and document.find(APOLLO_KEY, key + 1) == -1 and '"apolloState"' not in document:
+            colon = document.find(":", key + len(APOLLO_KEY))
+            start = colon + 1
+            while document[start:start + 1].isspace():
+                start += 1
+            try:
+                apollo, _ = json.JSONDecoder().raw_decode(document, start)
+            except ValueError:
+                apollo = None
+            if isinstance(apollo, dict) and apollo:
+                return apollo
+
+    return apollo_state(loads(document))
+
+def parse_next_data(html: str):
+    """Return the decoded __NEXT_DATA__ document of a page, or None if it has none."""
+    document = next_data_json(html)
+    if document is None:
+        return None
+    return loads(document)
+
+def parse_apollo_state(html: str):
+    """Return the Apollo cache of a page, or None if the page has no __NEXT_DATA__."""
+    document = next_data_json(html)
+    if document is None:
+        return None
+    return decode_apollo_state(document)
@@ -21,7 +21,7 @@ if %ERRORLEVEL% NEQ 0 (
 )
 
 REM 3. Commit and push
-git add src/listing_data.json
+git add src/listing_data.json listing_history.sqlite
 git commit -m "Daily Booli snapshot %date%"
 git pull --rebase
 git push
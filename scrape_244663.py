@@ -1,18 +1,16 @@
 import sys
 import json
-import re
 import scraper
 
 url = "https://www.booli.se/bostad/244663"
 print(f"Fetching {url}...")
 # use a large ttl_hours so it just reads from cache
 data, cached = scraper.fetch(url, ttl_hours=24)
-if data and data.get("html"):
+if data:
     print("Fetch successful.")
-    html = data["html"]
-    match = re.search(r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>', html, re.DOTALL)
-    if match:
-        next_data = json.loads(match.group(1))
+    # Works for both raw HTML and payload-only cache entries
+    next_data = scraper.page_next_data(data)
+    if next_data:
         
         # We can extract the Apollo state to see the object
         page_props = next_data.get("props", {}).get("pageProps", {})
@@ -1,16 +1,32 @@
 import os
 import sys
+import asyncio
 import time
 import json
 import hashlib
+import importlib.util
+import gzip
 import random
 import re
 import glob
+import sqlite3
+import threading
+import queue
+import multiprocessing
 import urllib.parse
-from datetime import datetime, timedelta, timezone
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
 from bs4 import BeautifulSoup
 from curl_cffi import requests
 
+import history
+import payload
+
+# lxml parses pages several times faster than the bundled html.parser; use it when installed
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
 # =====================
 # ANTIGRAVITY CONFIG
 # =====================
@@ -33,191 +49,846 @@ ENRICH_APARTMENTS = True
 DELAY_SECONDS = float(os.getenv("CRAWL_DELAY_SECONDS", "12.0"))
 CACHE_TTL_HOURS = int(os.getenv("CACHE_TTL_HOURS", "72"))
 CACHE_DIR = os.getenv("CACHE_DIR", "./booli_cache")
+# Cache budget: entries past the max age are dropped, then least recently used ones until under the byte budget
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+CACHE_MAX_AGE_DAYS = float(os.getenv("CACHE_MAX_AGE_DAYS", "14"))
 SCRAPER_API_KEY = os.getenv("SCRAPER_API_KEY", "")
 SCRAPINGBEE_API_KEY = os.getenv("SCRAPINGBEE_API_KEY", "")
 ZENROWS_API_KEY = os.getenv("ZENROWS_API_KEY", "")
 SCRAPINGANT_API_KEY = os.getenv("SCRAPINGANT_API_KEY", "")
 USE_PLAYWRIGHT = os.getenv("USE_PLAYWRIGHT", "").lower() in ("1", "true", "yes")
 PLAYWRIGHT_HEADLESS = os.getenv("PLAYWRIGHT_HEADLESS", "1").lower() in ("1", "true", "yes")
+# Browser pages loading at the same time in Playwright mode, each in its own context
+PLAYWRIGHT_POOL_SIZE = int(os.getenv("PLAYWRIGHT_POOL_SIZE", os.getenv("CRAWL_CONCURRENCY", "4")))
+# Abort images, media, fonts, CSS and analytics; only the document is needed
+PLAYWRIGHT_BLOCK_RESOURCES = os.getenv("PLAYWRIGHT_BLOCK_RESOURCES", "1").lower() in ("1", "true", "yes")
+PLAYWRIGHT_BLOCKED_TYPES = {"image", "media", "font", "stylesheet"}
+PLAYWRIGHT_BLOCKED_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "facebook.net", "facebook.com", "hotjar.com", "clarity.ms", "bat.bing.com", "snap.licdn.com",
+)
+# Return as soon as __NEXT_DATA__ is complete instead of waiting a fixed 2-4s after domcontentloaded
+PLAYWRIGHT_EARLY_RETURN = os.getenv("PLAYWRIGHT_EARLY_RETURN", "1").lower() in ("1", "true", "yes")
+# Longest a crawl thread waits for one Playwright fetch, including the wait for a free page
+PLAYWRIGHT_FETCH_TIMEOUT_SECONDS = float(os.getenv("PLAYWRIGHT_FETCH_TIMEOUT_SECONDS", "180"))
+# Optional JSON file adding to or overriding the built-in property tag vocabulary (see TAG MATCHING)
+TAG_VOCABULARY_PATH = os.getenv("TAG_VOCABULARY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tag_vocabulary.json"))
+# "payload" caches only the Apollo state, visible text and pagination links of a page; "html" caches the raw page
+CACHE_MODE = os.getenv("CACHE_MODE", "payload").lower()
+
+# Objects accepted during a crawl are appended to this JSON Lines file and sorted into the snapshot at the end ("" keeps them in memory)
+SNAPSHOT_STREAM_PATH = os.getenv("SNAPSHOT_STREAM_PATH", os.path.join("snapshots", "in_progress", "crawl.jsonl"))
+# Crawl state saved for --resume every CHECKPOINT_INTERVAL_SECONDS ("" disables checkpoints). Kept out of
+# snapshots/*.json, which the entry point prunes and analyze.py reads as input.
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", os.path.join("snapshots", "in_progress", "crawl_checkpoint.json"))
+CHECKPOINT_INTERVAL_SECONDS = float(os.getenv("CHECKPOINT_INTERVAL_SECONDS", "30"))
+
+# Number of pages fetched at the same time
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "4"))
+# Parser processes extracting objects from fetched pages (0 parses inline in the crawl loop)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Fetched pages allowed to wait for a parser before fetch threads pause
+PARSE_QUEUE_SIZE = int(os.getenv("PARSE_QUEUE_SIZE", str(2 * max(1, PARSE_WORKERS))))
+# Search configs crawled at the same time (0 = all at once). Objects of a config
+# wait in memory until every config before it is done, so this bounds that backlog.
+CONFIGS_IN_FLIGHT = int(os.getenv("CONFIGS_IN_FLIGHT", "2"))
+# Warm curl_cffi sessions kept for direct fetches, rotated over these impersonation profiles
+SESSION_POOL_SIZE = int(os.getenv("SESSION_POOL_SIZE", str(CRAWL_CONCURRENCY)))
+SESSION_PROFILES = ["chrome124", "chrome120", "safari17_0", "edge101"]
+# How long a fetch waits for a free session before giving up on the URL
+SESSION_LEASE_TIMEOUT_SECONDS = float(os.getenv("SESSION_LEASE_TIMEOUT_SECONDS", "600"))
+# Requests per second allowed against booli.se directly (defaults to one per DELAY_SECONDS)
+BOOLI_RATE_PER_SECOND = float(os.getenv("BOOLI_RATE_PER_SECOND", str(1.0 / DELAY_SECONDS if DELAY_SECONDS > 0 else 0)))
+# Requests per second allowed against each proxy API
+PROXY_RATE_PER_SECOND = float(os.getenv("PROXY_RATE_PER_SECOND", "1.0"))
+# Per-host token buckets: host -> (requests per second, burst). A rate of 0 disables limiting.
+RATE_LIMITS = {
+    "www.booli.se": (BOOLI_RATE_PER_SECOND, 1),
+    "api.zenrows.com": (PROXY_RATE_PER_SECOND, CRAWL_CONCURRENCY),
+    "app.scrapingbee.com": (PROXY_RATE_PER_SECOND, CRAWL_CONCURRENCY),
+    "api.scrapingant.com": (PROXY_RATE_PER_SECOND, CRAWL_CONCURRENCY),
+    "api.scraperapi.com": (PROXY_RATE_PER_SECOND, CRAWL_CONCURRENCY),
+}
+# Credits each proxy API bills for one successful page (ZenRows premium proxies cost 10)
+PROXY_CREDITS = {
+    "zenrows": 10,
+    "scrapingbee": 1,
+    "scrapingant": 1,
+    "scraperapi": 1,
+}
+# Credits one second of proxy latency is worth when ordering backends
+PROXY_LATENCY_WEIGHT = float(os.getenv("PROXY_LATENCY_WEIGHT", "0.5"))
+# Start a hedged request on the next backend after this many seconds (0 = the current backend's tail latency)
+HEDGE_AFTER_SECONDS = float(os.getenv("HEDGE_AFTER_SECONDS", "0"))
+# Latency quantile used as the adaptive hedge threshold
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.9"))
+# Consecutive failures that open a backend's circuit, and the first cooldown (doubles on each re-open)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "3600"))
+# Statuses that mean the backend worked, even if the page itself is gone
+BACKEND_HEALTHY_STATUSES = (200, 304, 404, 410)
+# Backend health scoreboard, persisted next to the page cache so it survives between runs
+PROVIDER_HEALTH_PATH = os.path.join(CACHE_DIR, "provider_health.json")
+# Append-only listing history (see history.py); committed with the daily snapshot, since the page cache is disposable
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", history.DEFAULT_PATH)
 
 os.makedirs(CACHE_DIR, exist_ok=True)
 
-if SCRAPER_API_KEY:
+# Parser worker processes re-import this module; only the crawling process announces its setup
+IS_PARSER_WORKER = multiprocessing.parent_process() is not None
+
+if SCRAPER_API_KEY and not IS_PARSER_WORKER:
     print("ScraperAPI key detected — will route requests through ScraperAPI.")
-if SCRAPINGBEE_API_KEY:
+if SCRAPINGBEE_API_KEY and not IS_PARSER_WORKER:
     print("ScrapingBee key detected — will route requests through ScrapingBee.")
-if ZENROWS_API_KEY:
+if ZENROWS_API_KEY and not IS_PARSER_WORKER:
     print("ZenRows key detected — will route requests through ZenRows.")
-if SCRAPINGANT_API_KEY:
+if SCRAPINGANT_API_KEY and not IS_PARSER_WORKER:
     print("ScrapingAnt key detected — will route requests through ScrapingAnt.")
-if USE_PLAYWRIGHT:
-    print(f"Playwright mode enabled (headless={PLAYWRIGHT_HEADLESS}).")
+if USE_PLAYWRIGHT and not IS_PARSER_WORKER:
+    print(f"Playwright mode enabled (headless={PLAYWRIGHT_HEADLESS}, pages={PLAYWRIGHT_POOL_SIZE}).")
 
 # =====================
 # CACHE
 # =====================
-def cache_path(url: str) -> str:
-    key = hashlib.sha256(url.encode()).hexdigest()
-    return os.path.join(CACHE_DIR, f"{key}.json")
+# Entries are gzip-compressed JSON sharded as CACHE_DIR/ab/cd/<sha256>.json.gz.
+# A single SQLite index maps url -> (key, fetchedAt, size, status, validators) so
+# TTL checks and statistics never have to stat or open the entry files.
+CACHE_INDEX_PATH = os.path.join(CACHE_DIR, "index.sqlite")
+# Columns added to the index after it was first introduced, migrated in place
+CACHE_INDEX_EXTRA_COLUMNS = [
+    ("etag", "TEXT"),
+    ("last_modified", "TEXT"),
+    ("parser", "TEXT"),
+    ("objects", "BLOB"),
+    ("last_access", "REAL"),
+    ("hits", "INTEGER NOT NULL DEFAULT 0"),
+    ("fetches", "INTEGER NOT NULL DEFAULT 0"),
+]
+# Extracted objects stored in the index are only reused by the same scraper.py and tag vocabulary
+PARSER_VERSION = hashlib.sha256(
+    open(__file__, "rb").read()
+    + (open(TAG_VOCABULARY_PATH, "rb").read() if os.path.exists(TAG_VOCABULARY_PATH) else b"")
+).hexdigest()[:16]
+_cache_db = None
+_cache_lock = threading.Lock()
+
+# Bytes and proxy credits saved by 304 revalidation during this run
+revalidation_stats = {"notModified": 0, "bytesSaved": 0, "creditsSaved": 0}
+
+def cache_db():
+    global _cache_db
+    if _cache_db is None:
+        _cache_db = sqlite3.connect(CACHE_INDEX_PATH, check_same_thread=False)
+        _cache_db.row_factory = sqlite3.Row
+        _cache_db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                status INTEGER
+            )
+        """)
+        columns = {row["name"] for row in _cache_db.execute("PRAGMA table_info(entries)")}
+        for column, decl in CACHE_INDEX_EXTRA_COLUMNS:
+            if column not in columns:
+                _cache_db.execute(f"ALTER TABLE entries ADD COLUMN {column} {decl}")
+        _cache_db.commit()
+    return _cache_db
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
 
-def cache_valid(path: str, ttl_hours: int = None) -> bool:
-    if not os.path.exists(path):
-        return False
+def cache_path(url: str) -> str:
+    key = cache_key(url)
+    return os.path.join(CACHE_DIR, key[:2], key[2:4], f"{key}.json.gz")
+
+def legacy_cache_path(url: str) -> str:
+    """Flat, uncompressed layout used before the sharded cache."""
+    return os.path.join(CACHE_DIR, f"{cache_key(url)}.json")
+
+def _select_entry(url: str):
+    with _cache_lock:
+        return cache_db().execute(
+            "SELECT key, fetched_at, size, status, etag, last_modified FROM entries WHERE url = ?", (url,)
+        ).fetchone()
+
+def cache_lookup(url: str):
+    """Return the index row for `url` (key, fetched_at, size, status, etag, last_modified), or None."""
+    row = _select_entry(url)
+    if row is None:
+        row = migrate_legacy_entry(url)
+    return row
+
+def entry_fresh(entry, ttl_hours: int = None) -> bool:
     ttl = ttl_hours if ttl_hours is not None else CACHE_TTL_HOURS
-    age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(path))
-    return age < timedelta(hours=ttl)
-
-# Curl_cffi global session (optional, but good for connection pooling)
-_session = None
-
-def get_session():
-    global _session
-    if _session is None:
-        print("Initializing curl_cffi session...")
-        # Prioritize modern and stable Chrome profiles
-        profiles = ["chrome124", "chrome120", "chrome116", "safari17_0", "edge101"]
-        profile = random.choice(profiles)
-        print(f"Using impersonate profile: {profile}")
-        
-        _session = requests.Session(impersonate=profile, timeout=60)
-        
-        # Sec-CH-UA headers only for Chrome
-        ua_headers = {}
-        if profile.startswith("chrome"):
-            v = profile.replace("chrome", "")
-            ua_headers = {
-                "sec-ch-ua": f'"Chromium";v="{v}", "Google Chrome";v="{v}", "Not-A.Brand";v="99"',
-                "sec-ch-ua-mobile": "?0",
-                "sec-ch-ua-platform": '"Windows"'
-            }
-        
-        # Realistic headers for a standard browser
-        _session.headers.update({
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-            "Accept-Language": "sv-SE,sv;q=0.9,en-US;q=0.8,en;q=0.7",
-            # "Accept-Encoding": "gzip, deflate, br, zstd", # Let curl_cffi handle this
-            "Referer": "https://www.google.se/",
-            "Sec-Fetch-Dest": "document",
-            "Sec-Fetch-Mode": "navigate",
-            "Sec-Fetch-Site": "cross-site",
-            "Sec-Fetch-User": "?1",
-            "Upgrade-Insecure-Requests": "1"
+    return time.time() - entry["fetched_at"] < ttl * 3600
+
+def cache_valid(url: str, ttl_hours: int = None) -> bool:
+    entry = cache_lookup(url)
+    return entry is not None and entry_fresh(entry, ttl_hours)
+
+def cache_read(url: str):
+    try:
+        with gzip.open(cache_path(url), "rb") as f:
+            return payload.loads(f.read())
+    except (OSError, ValueError) as e:
+        print(f"Warning: Unreadable cache entry for {url}: {e}", file=sys.stderr)
+        return None
+
+def cache_write(url: str, data: dict, fetched_at: float = None, headers=None):
+    path = cache_path(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    blob = gzip.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    # Write to a temp file + rename so a concurrent reader never sees a partial entry
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(blob)
+    os.replace(temp_path, path)
+
+    etag, last_modified = response_validators(headers)
+    now = time.time()
+    with _cache_lock:
+        db = cache_db()
+        # A new body invalidates the objects extracted from the previous one
+        db.execute(
+            """
+            INSERT INTO entries (url, key, fetched_at, size, status, etag, last_modified, last_access, fetches)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(url) DO UPDATE SET
+                fetched_at = excluded.fetched_at, size = excluded.size, status = excluded.status,
+                etag = excluded.etag, last_modified = excluded.last_modified, last_access = excluded.last_access,
+                parser = NULL, objects = NULL, fetches = fetches + 1
+            """,
+            (url, cache_key(url), fetched_at if fetched_at is not None else now, len(blob), data.get("status"), etag, last_modified, now),
+        )
+        db.commit()
+
+def cache_mark_hit(url: str, renew: bool = False):
+    """Record a cache hit for LRU eviction and stats; `renew` restarts the TTL (after a 304)."""
+    now = time.time()
+    with _cache_lock:
+        db = cache_db()
+        if renew:
+            db.execute("UPDATE entries SET fetched_at = ?, last_access = ?, hits = hits + 1 WHERE url = ?", (now, now, url))
+        else:
+            db.execute("UPDATE entries SET last_access = ?, hits = hits + 1 WHERE url = ?", (now, url))
+        db.commit()
+
+def cache_remove(url: str):
+    with _cache_lock:
+        db = cache_db()
+        db.execute("DELETE FROM entries WHERE url = ?", (url,))
+        db.commit()
+    try:
+        os.remove(cache_path(url))
+    except OSError:
+        pass
+
+def cache_read_objects(url: str):
+    """Return objects previously extracted from the cached body, or None if stale or missing."""
+    with _cache_lock:
+        row = cache_db().execute("SELECT parser, objects FROM entries WHERE url = ?", (url,)).fetchone()
+    if row is None or row["parser"] != PARSER_VERSION or row["objects"] is None:
+        return None
+    return payload.loads(gzip.decompress(row["objects"]))
+
+def cache_write_objects(url: str, objects: list):
+    blob = gzip.compress(json.dumps(objects, ensure_ascii=False).encode("utf-8"))
+    with _cache_lock:
+        db = cache_db()
+        db.execute("UPDATE entries SET parser = ?, objects = ? WHERE url = ?", (PARSER_VERSION, blob, url))
+        db.commit()
+
+def migrate_legacy_entry(url: str):
+    """Move a flat `<sha256>.json` entry into the sharded cache, keeping its age."""
+    legacy_path = legacy_cache_path(url)
+    if not os.path.exists(legacy_path):
+        return None
+    try:
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        cache_write(url, data, fetched_at=os.path.getmtime(legacy_path))
+        os.remove(legacy_path)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Failed to migrate legacy cache entry {legacy_path}: {e}", file=sys.stderr)
+        return None
+    return _select_entry(url)
+
+# =====================
+# CACHE MAINTENANCE
+# =====================
+CACHE_AGE_BUCKETS = [
+    ("< 2h", 2 * 3600),
+    ("< 1d", 24 * 3600),
+    ("< 3d", 3 * 24 * 3600),
+    ("< 7d", 7 * 24 * 3600),
+    ("< 30d", 30 * 24 * 3600),
+    (">= 30d", float("inf")),
+]
+
+def url_type(url: str) -> str:
+    path = urllib.parse.urlparse(url).path
+    if path.startswith("/bostad/") or path.startswith("/annons/"):
+        return "detail"
+    if path.startswith("/sok/") or path.startswith("/slutpriser"):
+        return "search"
+    return "other"
+
+def cache_stats() -> dict:
+    """Summarize the cache from the index alone: hit ratio, size by URL type and age histogram."""
+    now = time.time()
+    with _cache_lock:
+        rows = cache_db().execute("SELECT url, fetched_at, size, hits, fetches FROM entries").fetchall()
+    by_type = {}
+    ages = {label: 0 for label, _ in CACHE_AGE_BUCKETS}
+    hits = fetches = total = 0
+    for row in rows:
+        kind = by_type.setdefault(url_type(row["url"]), {"entries": 0, "bytes": 0})
+        kind["entries"] += 1
+        kind["bytes"] += row["size"]
+        total += row["size"]
+        hits += row["hits"]
+        fetches += row["fetches"]
+        age = now - row["fetched_at"]
+        ages[next(label for label, limit in CACHE_AGE_BUCKETS if age < limit)] += 1
+    return {
+        "entries": len(rows),
+        "bytes": total,
+        "maxBytes": CACHE_MAX_BYTES,
+        "hitRatio": hits / (hits + fetches) if hits + fetches else 0,
+        "byType": by_type,
+        "ages": ages,
+    }
+
+def cache_gc(max_bytes: int = None, max_age_days: float = None) -> dict:
+    """Drop entries older than `max_age_days`, then evict least recently used ones until under `max_bytes`."""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_days = CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    cutoff = time.time() - max_age_days * 24 * 3600
+    with _cache_lock:
+        rows = cache_db().execute(
+            "SELECT url, fetched_at, size FROM entries ORDER BY COALESCE(last_access, fetched_at) ASC"
+        ).fetchall()
+    total = sum(row["size"] for row in rows)
+    evict = []
+    for row in rows:
+        if row["fetched_at"] < cutoff or (max_bytes and total > max_bytes):
+            evict.append(row["url"])
+            total -= row["size"]
+    for url in evict:
+        cache_remove(url)
+
+    # Flat entries from before the sharded cache are only migrated when looked up
+    legacy_removed = 0
+    for path in glob.glob(os.path.join(CACHE_DIR, "*.json")):
+        if path == PROVIDER_HEALTH_PATH:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                legacy_removed += 1
+        except OSError:
+            pass
+    return {"evicted": len(evict), "legacyRemoved": legacy_removed, "bytes": total}
+
+def cache_verify(fix: bool = False) -> dict:
+    """Check that every indexed entry is readable and every entry file is indexed."""
+    with _cache_lock:
+        rows = cache_db().execute("SELECT url, key, size FROM entries").fetchall()
+    broken = []
+    indexed = set()
+    for row in rows:
+        path = cache_path(row["url"])
+        indexed.add(os.path.abspath(path))
+        try:
+            if os.path.getsize(path) != row["size"]:
+                raise ValueError("size mismatch")
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Broken cache entry {row['url']}: {e}", file=sys.stderr)
+            broken.append(row["url"])
+    orphans = [
+        path for path in glob.glob(os.path.join(CACHE_DIR, "*", "*", "*.json.gz"))
+        if os.path.abspath(path) not in indexed
+    ]
+    if fix:
+        for url in broken:
+            cache_remove(url)
+        for path in orphans:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return {"entries": len(rows), "broken": len(broken), "orphans": len(orphans), "fixed": fix}
+
+def cache_command(action: str, fix: bool = False) -> int:
+    """Entry point for `scraper.py cache stats|gc|verify`."""
+    if action == "stats":
+        stats = cache_stats()
+        print(f"Entries: {stats['entries']}  size: {stats['bytes'] / 1048576:.1f} MB (budget {stats['maxBytes'] / 1048576:.0f} MB)")
+        print(f"Hit ratio: {stats['hitRatio']:.1%}")
+        for kind, info in sorted(stats["byType"].items()):
+            print(f"  {kind:<7} {info['entries']:>6} entries  {info['bytes'] / 1048576:8.1f} MB")
+        print("Age:")
+        for label, count in stats["ages"].items():
+            print(f"  {label:<7} {count:>6}")
+    elif action == "gc":
+        result = cache_gc()
+        print(f"Evicted {result['evicted']} entries and {result['legacyRemoved']} legacy files; {result['bytes'] / 1048576:.1f} MB left.")
+    elif action == "verify":
+        result = cache_verify(fix=fix)
+        print(f"Checked {result['entries']} entries: {result['broken']} broken, {result['orphans']} orphaned files" + (" (removed)." if fix else "."))
+        if (result["broken"] or result["orphans"]) and not fix:
+            return 1
+    return 0
+
+# =====================
+# REVALIDATION
+# =====================
+# Proxy APIs echo the target's response headers under these prefixes
+VALIDATOR_HEADER_PREFIXES = ("", "spb-", "zr-", "ant-")
+
+def response_validators(headers):
+    """Return (etag, last_modified) from response headers, if the server sent any."""
+    etag = last_modified = None
+    for name, value in (headers or {}).items():
+        name = name.lower()
+        for prefix in VALIDATOR_HEADER_PREFIXES:
+            if name == f"{prefix}etag":
+                etag = value
+            elif name == f"{prefix}last-modified":
+                last_modified = value
+    return etag, last_modified
+
+def conditional_headers(entry) -> dict:
+    """Build If-None-Match / If-Modified-Since headers for an expired cache entry."""
+    headers = {}
+    if entry is None:
+        return headers
+    if entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def not_modified(url: str, provider: str = None):
+    """Handle a 304: renew the cached entry and return it as a cache hit."""
+    data = cache_read(url)
+    if data is None:
+        cache_remove(url)
+        return None, False
+    cache_mark_hit(url, renew=True)
+    revalidation_stats["notModified"] += 1
+    revalidation_stats["bytesSaved"] += data.get("htmlBytes") or len(data.get("html", "").encode("utf-8"))
+    revalidation_stats["creditsSaved"] += PROXY_CREDITS.get(provider, 0)
+    print(f"Not modified: {url}" + (f" (via {provider})" if provider else ""))
+    return data, True
+
+# =====================
+# RATE LIMITING
+# =====================
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until it is available."""
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve the token up front so waiting callers are served in arrival order
+            self.tokens -= 1
+            wait_time = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def throttle(url: str):
+    """Block until the host of `url` has capacity for another request."""
+    host = urllib.parse.urlparse(url).hostname or ""
+    with _rate_limiters_lock:
+        bucket = _rate_limiters.get(host)
+        if bucket is None:
+            rate, burst = RATE_LIMITS.get(host, (PROXY_RATE_PER_SECOND, 1))
+            bucket = TokenBucket(rate, burst)
+            _rate_limiters[host] = bucket
+    bucket.acquire()
+
+# =====================
+# SESSION POOL
+# =====================
+def new_session(profile: str):
+    """Create a curl_cffi session impersonating `profile` with realistic browser headers."""
+    session = requests.Session(impersonate=profile, timeout=60)
+    
+    # Realistic headers for a standard browser
+    session.headers.update({
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+        "Accept-Language": "sv-SE,sv;q=0.9,en-US;q=0.8,en;q=0.7",
+        # "Accept-Encoding": "gzip, deflate, br, zstd", # Let curl_cffi handle this
+        "Referer": "https://www.google.se/",
+        "Sec-Fetch-Dest": "document",
+        "Sec-Fetch-Mode": "navigate",
+        "Sec-Fetch-Site": "cross-site",
+        "Sec-Fetch-User": "?1",
+        "Upgrade-Insecure-Requests": "1"
+    })
+    
+    # Sec-CH-UA headers only for Chrome
+    if profile.startswith("chrome"):
+        v = profile.replace("chrome", "")
+        session.headers.update({
+            "sec-ch-ua": f'"Chromium";v="{v}", "Google Chrome";v="{v}", "Not-A.Brand";v="99"',
+            "sec-ch-ua-mobile": "?0",
+            "sec-ch-ua-platform": '"Windows"'
         })
-        if ua_headers:
-            _session.headers.update(ua_headers)
-        
-        # Visit home page once with random wait (imitating a user)
+    return session
+
+def warm_session(session, profile: str):
+    """Visit the home page once with a random wait (imitating a user)."""
+    try:
+        print(f"Warming {profile} session on home page...")
+        throttle("https://www.booli.se/")
+        resp = session.get("https://www.booli.se/")
+        if resp.status_code != 200:
+            print(f"Warning: Home page returned status {resp.status_code} for {profile} session", file=sys.stderr)
+        time.sleep(random.uniform(4.0, 8.0))
+    except Exception as e:
+        print(f"Warning: Failed to visit home page with {profile} session: {e}", file=sys.stderr)
+
+class SessionPool:
+    """Warm curl_cffi sessions spread over SESSION_PROFILES, leased one request at a time.
+
+    Sessions are warmed in parallel in the background. A session that gets blocked
+    is retired and a replacement with another profile starts warming right away,
+    so other fetches keep going on the sessions that are still healthy.
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self.idle = queue.Queue()
+        self.profiles = {}
+        self.warming = 0
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def _add(self, profile: str):
+        # A profile curl_cffi cannot create falls over to the next one; a failed
+        # warm-up still leaves a usable cold session
         try:
-            print("Visiting home page to establish session...")
-            resp = _session.get("https://www.booli.se/")
-            if resp.status_code != 200:
-                print(f"Warning: Home page returned status {resp.status_code}", file=sys.stderr)
-            time.sleep(random.uniform(4.0, 8.0))
-        except Exception as e:
-            print(f"Warning: Failed to visit home page: {e}", file=sys.stderr)
-            time.sleep(2.0) # Small fallback wait
-            
-    return _session
+            session = None
+            for candidate in [profile] + [p for p in SESSION_PROFILES if p != profile]:
+                try:
+                    session = new_session(candidate)
+                    break
+                except Exception as e:
+                    print(f"Warning: Could not create a {candidate} session: {e}", file=sys.stderr)
+            if session is None:
+                return
+            try:
+                warm_session(session, candidate)
+            except Exception as e:
+                print(f"Warning: Warming the {candidate} session failed ({e}); using it cold.", file=sys.stderr)
+            with self.lock:
+                self.profiles[session] = candidate
+            self.idle.put(session)
+        finally:
+            with self.lock:
+                self.warming -= 1
+
+    def _submit(self, profile: str):
+        # Called with self.lock held
+        self.warming += 1
+        self.executor.submit(self._add, profile)
+
+    def _start(self):
+        with self.lock:
+            if self.executor is not None:
+                return
+            print(f"Warming {self.size} curl_cffi sessions...")
+            self.executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="session")
+            for i in range(self.size):
+                self._submit(SESSION_PROFILES[i % len(SESSION_PROFILES)])
+
+    def lease(self):
+        """Take a warm session, waiting for one if all are busy or still warming.
+
+        Raises RuntimeError when no session could be created at all, or none
+        became free within SESSION_LEASE_TIMEOUT_SECONDS.
+        """
+        self._start()
+        deadline = time.monotonic() + SESSION_LEASE_TIMEOUT_SECONDS
+        while True:
+            try:
+                return self.idle.get(timeout=max(0.0, min(1.0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            with self.lock:
+                if not self.profiles and not self.warming:
+                    raise RuntimeError("No curl_cffi session could be created.")
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"No curl_cffi session became free within {SESSION_LEASE_TIMEOUT_SECONDS:.0f}s.")
+
+    def release(self, session):
+        self.idle.put(session)
+
+    def retire(self, session):
+        """Drop a blocked session and warm a replacement with a different profile."""
+        with self.lock:
+            profile = self.profiles.pop(session, None)
+            replacement = random.choice([p for p in SESSION_PROFILES if p != profile] or SESSION_PROFILES)
+            # Counted as warming before the lock is released, so the pool never looks empty to lease()
+            if self.executor is not None:
+                self._submit(replacement)
+        try:
+            session.close()
+        except Exception:
+            pass
+        print(f"Retiring {profile} session, warming a {replacement} replacement.", file=sys.stderr)
+
+    def close(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is None:
+            return
+        executor.shutdown(wait=True)
+        while not self.idle.empty():
+            try:
+                self.idle.get_nowait().close()
+            except Exception:
+                pass
+        with self.lock:
+            self.profiles.clear()
+
+session_pool = SessionPool(SESSION_POOL_SIZE)
 
 def close_browser():
-    global _session
-    if _session:
-        _session.close()
-        _session = None
+    session_pool.close()
     close_playwright()
 
 # =====================
 # PLAYWRIGHT
 # =====================
+# Playwright runs on its own asyncio loop in a background thread so several
+# pages can load at once. Crawl threads submit coroutines to that loop and
+# block on the result. Every pooled page has its own browser context.
+_pw_loop = None
+_pw_thread = None
+_pw_lock = threading.Lock()
 _pw_instance = None
 _pw_browser = None
-_pw_context = None
-_pw_page = None
-
-def get_playwright_page():
-    global _pw_instance, _pw_browser, _pw_context, _pw_page
-    if _pw_page is not None:
-        return _pw_page
-
-    from playwright.sync_api import sync_playwright
+_pw_pages = None
+# Running _pw_fetch tasks, cancelled when the browser is closed under them
+_pw_tasks = set()
+_pw_stats = {"pages": 0, "blocked": 0}
+
+# True once the __NEXT_DATA__ script is in the DOM and holds complete JSON
+NEXT_DATA_READY_JS = """() => {
+    const el = document.getElementById('__NEXT_DATA__');
+    if (!el) return false;
+    try { JSON.parse(el.textContent); return true; } catch (e) { return false; }
+}"""
+
+def _pw_call(coro, timeout: float = None):
+    """Run a coroutine on the Playwright loop, starting browser and page pool on first use."""
+    global _pw_loop, _pw_thread
+    with _pw_lock:
+        if _pw_loop is None:
+            _pw_loop = asyncio.new_event_loop()
+            _pw_thread = threading.Thread(target=_pw_loop.run_forever, name="playwright", daemon=True)
+            _pw_thread.start()
+        if _pw_pages is None:
+            asyncio.run_coroutine_threadsafe(_pw_start(), _pw_loop).result()
+    future = asyncio.run_coroutine_threadsafe(coro, _pw_loop)
+    try:
+        return future.result(timeout=timeout)
+    except BaseException:
+        # Timed out or interrupted: stop the coroutine so it returns its page
+        future.cancel()
+        raise
+
+async def _pw_start():
+    global _pw_instance, _pw_browser, _pw_pages
+    from playwright.async_api import async_playwright
     from playwright_stealth import Stealth
 
-    print("Initializing Playwright (stealth)...")
-    stealth = Stealth()
-    _pw_instance = stealth.use_sync(sync_playwright()).__enter__()
-    _pw_browser = _pw_instance.chromium.launch(
+    print(f"Initializing Playwright (stealth) with {PLAYWRIGHT_POOL_SIZE} pages...")
+    _pw_instance = await Stealth().use_async(async_playwright()).__aenter__()
+    _pw_browser = await _pw_instance.chromium.launch(
         headless=PLAYWRIGHT_HEADLESS,
         args=["--disable-blink-features=AutomationControlled"],
     )
-    _pw_context = _pw_browser.new_context(
+    pages = await asyncio.gather(*[_pw_new_page() for _ in range(max(1, PLAYWRIGHT_POOL_SIZE))])
+    _pw_pages = asyncio.Queue()
+    for page in pages:
+        _pw_pages.put_nowait(page)
+
+async def _pw_new_page():
+    """Open a page in a fresh context and warm it up with a home page visit."""
+    context = await _pw_browser.new_context(
         locale="sv-SE",
         timezone_id="Europe/Stockholm",
         viewport={"width": 1440, "height": 900},
         user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
     )
-    _pw_page = _pw_context.new_page()
+    if PLAYWRIGHT_BLOCK_RESOURCES:
+        await context.route("**/*", _pw_route)
+    page = await context.new_page()
 
-    # Warm up with home page visit
     try:
-        print("Playwright: visiting home page...")
-        _pw_page.goto("https://www.booli.se/", wait_until="domcontentloaded", timeout=30000)
-        time.sleep(random.uniform(3.0, 5.0))
+        await asyncio.to_thread(throttle, "https://www.booli.se/")
+        await page.goto("https://www.booli.se/", wait_until="domcontentloaded", timeout=30000)
+        await asyncio.sleep(random.uniform(3.0, 5.0))
     except Exception as e:
         print(f"Playwright: home page warmup failed: {e}", file=sys.stderr)
 
-    return _pw_page
-
-def close_playwright():
-    global _pw_instance, _pw_browser, _pw_context, _pw_page
+    return page
+
+async def _pw_route(route):
+    """Abort requests that never contribute to page.content()."""
+    request = route.request
+    host = urllib.parse.urlparse(request.url).hostname or ""
+    if request.resource_type in PLAYWRIGHT_BLOCKED_TYPES or any(
+        host == blocked or host.endswith("." + blocked) for blocked in PLAYWRIGHT_BLOCKED_HOSTS
+    ):
+        _pw_stats["blocked"] += 1
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def _pw_replace(page):
+    """Swap a page whose context got challenged or broke for a freshly warmed one."""
     try:
-        if _pw_context:
-            _pw_context.close()
-        if _pw_browser:
-            _pw_browser.close()
+        await page.context.close()
     except Exception:
         pass
-    _pw_context = None
+    try:
+        return await _pw_new_page()
+    except Exception as e:
+        print(f"Playwright: could not open replacement page: {e}", file=sys.stderr)
+        return page
+
+async def _pw_fetch(url: str):
+    # The pool this fetch started on; _pw_close may replace the global while it runs
+    pages = _pw_pages
+    task = asyncio.current_task()
+    _pw_tasks.add(task)
+    page = None
+    healthy = False
+    try:
+        page = await pages.get()
+        if PLAYWRIGHT_EARLY_RETURN:
+            resp = await page.goto(url, wait_until="commit", timeout=45000)
+            try:
+                await page.wait_for_function(NEXT_DATA_READY_JS, polling=100, timeout=20000)
+            except Exception:
+                # No payload (challenge or error page); return whatever rendered
+                pass
+        else:
+            resp = await page.goto(url, wait_until="domcontentloaded", timeout=45000)
+            await asyncio.sleep(random.uniform(2.0, 4.0))
+        status = resp.status if resp else 0
+        headers = resp.headers if resp else {}
+        html = await page.content()
+        _pw_stats["pages"] += 1
+
+        if any(term in html for term in ["Just a moment", "Attention Required", "Verify you are human", "Checking your browser"]):
+            print(f"Playwright: Cloudflare challenge on {url}", file=sys.stderr)
+            status = 403
+
+        healthy = status in BACKEND_HEALTHY_STATUSES
+        return html, status, headers
+    finally:
+        _pw_tasks.discard(task)
+        # A page of a closed browser is dropped with it
+        if page is not None and pages is _pw_pages:
+            if not healthy:
+                page = await _pw_replace(page)
+            pages.put_nowait(page)
+
+async def _pw_close():
+    global _pw_instance, _pw_browser, _pw_pages
+    # Fetches still running hold pages of this browser, and those waiting for a
+    # page would never get one: cancel them so their callers can retry
+    current = asyncio.current_task()
+    for task in list(_pw_tasks):
+        if task is not current:
+            task.cancel()
+    browser, instance = _pw_browser, _pw_instance
+    _pw_pages = None
     _pw_browser = None
-    _pw_page = None
     _pw_instance = None
+    try:
+        if browser:
+            await browser.close()
+        if instance:
+            await instance.stop()
+    except Exception:
+        pass
+
+def close_playwright():
+    """Close the Playwright browser and stop its event loop."""
+    global _pw_loop, _pw_thread
+    with _pw_lock:
+        if _pw_loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(_pw_close(), _pw_loop).result()
+        _pw_loop.call_soon_threadsafe(_pw_loop.stop)
+        _pw_thread.join()
+        _pw_loop.close()
+        _pw_loop = None
+        _pw_thread = None
+    if _pw_stats["pages"]:
+        print(f"Playwright: loaded {_pw_stats['pages']} pages, blocked {_pw_stats['blocked']} subresource requests.")
 
 def fetch_via_playwright(url: str):
-    """Fetch a URL through a stealth Playwright browser."""
+    """Fetch a URL on a pooled stealth Playwright page."""
     max_retries = 2
     for attempt in range(max_retries + 1):
         try:
-            page = get_playwright_page()
             print(f"Fetching via Playwright: {url} (Attempt {attempt + 1})...")
-            resp = page.goto(url, wait_until="domcontentloaded", timeout=45000)
-            status = resp.status if resp else 0
-            time.sleep(random.uniform(2.0, 4.0))
-            html = page.content()
-
-            if any(term in html for term in ["Just a moment", "Attention Required", "Verify you are human", "Checking your browser"]):
-                print(f"Playwright: Cloudflare challenge on {url}", file=sys.stderr)
-                status = 403
+            throttle(url)
+            html, status, headers = _pw_call(_pw_fetch(url), PLAYWRIGHT_FETCH_TIMEOUT_SECONDS)
 
             if status == 200 and "__NEXT_DATA__" in html:
-                return html, status
+                return html, status, headers
 
             if attempt < max_retries:
                 wait = 8 * (attempt + 1) + random.uniform(2, 6)
                 print(f"Playwright: status {status}, retrying in {wait:.1f}s...", file=sys.stderr)
-                close_playwright()
                 time.sleep(wait)
                 continue
 
-            return html if status == 200 else None, status
+            return html if status == 200 else None, status, headers
         except Exception as e:
             print(f"Playwright error ({e}) on {url}", file=sys.stderr)
+            if _pw_browser is not None and not _pw_browser.is_connected():
+                # The browser itself died; start over on the next attempt
+                with _pw_lock:
+                    if _pw_loop is not None:
+                        asyncio.run_coroutine_threadsafe(_pw_close(), _pw_loop).result()
             if attempt < max_retries:
-                close_playwright()
                 time.sleep(5 + attempt * 5)
             else:
-                return None, 0
-    return None, 0
+                return None, 0, {}
+    return None, 0, {}
 
-def fetch_via_scraperapi(url: str):
+def fetch_via_scraperapi(url: str, headers: dict = None):
     """Fetch a URL through ScraperAPI (handles Cloudflare automatically)."""
     api_url = "https://api.scraperapi.com"
     params = {
@@ -225,16 +896,22 @@ def fetch_via_scraperapi(url: str):
         "url": url,
         "render": "false",
     }
+    if headers:
+        # Forward our request headers (e.g. conditional validators) to the target
+        params["keep_headers"] = "true"
     full_url = f"{api_url}?{urllib.parse.urlencode(params)}"
     
     max_retries = 3
     for attempt in range(max_retries + 1):
         try:
             print(f"Fetching via ScraperAPI: {url} (Attempt {attempt + 1})...")
-            response = requests.get(full_url, timeout=90)
+            throttle(full_url)
+            response = requests.get(full_url, headers=headers, timeout=90)
             
             if response.status_code == 200:
-                return response.text, response.status_code
+                return response.text, response.status_code, response.headers
+            if response.status_code == 304:
+                return None, response.status_code, response.headers
             
             if response.status_code in (429, 500, 502, 503) and attempt < max_retries:
                 wait = 10 * (attempt + 1) + random.uniform(2, 8)
@@ -243,7 +920,7 @@ def fetch_via_scraperapi(url: str):
                 continue
             
             print(f"ScraperAPI failed with status {response.status_code} for {url}", file=sys.stderr)
-            return None, response.status_code
+            return None, response.status_code, response.headers
             
         except Exception as e:
             if attempt < max_retries:
@@ -252,11 +929,11 @@ def fetch_via_scraperapi(url: str):
                 time.sleep(wait)
             else:
                 print(f"ScraperAPI request failed after {max_retries} retries: {e}", file=sys.stderr)
-                return None, 0
+                return None, 0, {}
     
-    return None, 0
+    return None, 0, {}
 
-def fetch_via_scrapingbee(url: str):
+def fetch_via_scrapingbee(url: str, headers: dict = None):
     """Fetch a URL through ScrapingBee."""
     api_url = "https://app.scrapingbee.com/api/v1"
     params = {
@@ -264,20 +941,27 @@ def fetch_via_scrapingbee(url: str):
         "url": url,
         "render_js": "false",
     }
+    if headers:
+        # ScrapingBee only forwards headers carrying its Spb- prefix
+        params["forward_headers"] = "true"
+        headers = {f"Spb-{k}": v for k, v in headers.items()}
     full_url = f"{api_url}?{urllib.parse.urlencode(params)}"
     
     try:
         print(f"Fetching via ScrapingBee: {url}...")
-        response = requests.get(full_url, timeout=90)
+        throttle(full_url)
+        response = requests.get(full_url, headers=headers, timeout=90)
         if response.status_code == 200:
-            return response.text, response.status_code
+            return response.text, response.status_code, response.headers
+        if response.status_code == 304:
+            return None, response.status_code, response.headers
         print(f"ScrapingBee failed with status {response.status_code} for {url}", file=sys.stderr)
-        return None, response.status_code
+        return None, response.status_code, response.headers
     except Exception as e:
         print(f"ScrapingBee request error: {e}", file=sys.stderr)
-        return None, 0
+        return None, 0, {}
 
-def fetch_via_zenrows(url: str):
+def fetch_via_zenrows(url: str, headers: dict = None):
     """Fetch a URL through ZenRows."""
     api_url = "https://api.zenrows.com/v1/"
     params = {
@@ -286,20 +970,25 @@ def fetch_via_zenrows(url: str):
         "premium_proxy": "true",
         "proxy_country": "se",
     }
+    if headers:
+        params["custom_headers"] = "true"
     full_url = f"{api_url}?{urllib.parse.urlencode(params)}"
     
     try:
         print(f"Fetching via ZenRows: {url}...")
-        response = requests.get(full_url, timeout=90)
+        throttle(full_url)
+        response = requests.get(full_url, headers=headers, timeout=90)
         if response.status_code == 200:
-            return response.text, response.status_code
+            return response.text, response.status_code, response.headers
+        if response.status_code == 304:
+            return None, response.status_code, response.headers
         print(f"ZenRows failed with status {response.status_code} for {url}", file=sys.stderr)
-        return None, response.status_code
+        return None, response.status_code, response.headers
     except Exception as e:
         print(f"ZenRows request error: {e}", file=sys.stderr)
-        return None, 0
+        return None, 0, {}
 
-def fetch_via_scrapingant(url: str):
+def fetch_via_scrapingant(url: str, headers: dict = None):
     """Fetch a URL through ScrapingAnt."""
     api_url = "https://api.scrapingant.com/v2/general"
     params = {
@@ -307,79 +996,326 @@ def fetch_via_scrapingant(url: str):
         "url": url,
         "browser": "false",
     }
+    if headers:
+        # ScrapingAnt forwards headers carrying its Ant- prefix
+        headers = {f"Ant-{k}": v for k, v in headers.items()}
     full_url = f"{api_url}?{urllib.parse.urlencode(params)}"
     
     try:
         print(f"Fetching via ScrapingAnt: {url}...")
-        response = requests.get(full_url, timeout=90)
+        throttle(full_url)
+        response = requests.get(full_url, headers=headers, timeout=90)
         if response.status_code == 200:
-            return response.text, response.status_code
+            return response.text, response.status_code, response.headers
+        if response.status_code == 304:
+            return None, response.status_code, response.headers
         print(f"ScrapingAnt failed with status {response.status_code} for {url}", file=sys.stderr)
-        return None, response.status_code
+        return None, response.status_code, response.headers
     except Exception as e:
         print(f"ScrapingAnt request error: {e}", file=sys.stderr)
-        return None, 0
+        return None, 0, {}
 
 
-def fetch(url: str, ttl_hours: int = None):
-    path = cache_path(url)
+# =====================
+# PROXY SCHEDULING
+# =====================
+class ProviderStats:
+    """Rolling health of one fetch backend, with a circuit breaker.
+
+    After CIRCUIT_FAILURE_THRESHOLD consecutive failures the circuit opens and the
+    backend is skipped until `cooldown_until`. Then a single probe request is let
+    through: success closes the circuit, failure re-opens it with a doubled cooldown.
+    The direct fetch is the last resort and is only slowed down, never skipped.
+    """
+
+    WINDOW = 50
+    # Used until a backend has enough samples of its own
+    PRIOR_LATENCY = 15.0
+    MIN_SAMPLES = 5
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = deque(maxlen=self.WINDOW)
+        self.outcomes = deque(maxlen=self.WINDOW)
+        self.consecutive_failures = 0
+        self.last_failure_status = None
+        self.last_failure_at = None
+        self.cooldown_until = 0.0
+        self.open_count = 0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def record(self, ok: bool, latency: float, status: int = None):
+        with self.lock:
+            self.outcomes.append(ok)
+            self.probing = False
+            if ok:
+                self.latencies.append(latency)
+                if self.open_count:
+                    print(f"Circuit for {self.name} closed again.")
+                self.consecutive_failures = 0
+                self.open_count = 0
+                self.cooldown_until = 0.0
+                return
+            self.consecutive_failures += 1
+            self.last_failure_status = status
+            self.last_failure_at = time.time()
+            if self.consecutive_failures < CIRCUIT_FAILURE_THRESHOLD:
+                return
+            cooldown = min(CIRCUIT_COOLDOWN_SECONDS * (2 ** self.open_count), 24 * 3600)
+            self.open_count += 1
+            self.cooldown_until = time.time() + cooldown
+        print(f"Circuit for {self.name} opened after status {status}; skipping it for {cooldown / 60:.0f} min.", file=sys.stderr)
+        save_provider_health()
+
+    def release_probe(self):
+        """Give back a claimed probe slot after an outcome that says nothing about the backend."""
+        with self.lock:
+            self.probing = False
+
+    def allow_request(self) -> bool:
+        """Whether a request may go to this backend now (claims the probe slot when half-open)."""
+        with self.lock:
+            if not self.open_count:
+                return True
+            if time.time() < self.cooldown_until or self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def success_rate(self) -> float:
+        # Laplace smoothing keeps an unseen backend at 50% instead of 0 or 1
+        with self.lock:
+            return (sum(self.outcomes) + 1) / (len(self.outcomes) + 2)
+
+    def latency(self, quantile: float = 0.5) -> float:
+        with self.lock:
+            if len(self.latencies) < self.MIN_SAMPLES:
+                return self.PRIOR_LATENCY
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def score(self) -> float:
+        """Expected cost of getting a page from this backend; lower is better."""
+        cost = PROXY_CREDITS.get(self.name, 0) + PROXY_LATENCY_WEIGHT * self.latency()
+        return cost / self.success_rate()
+
+    def hedge_delay(self) -> float:
+        """How long to wait on this backend before racing the next one."""
+        if HEDGE_AFTER_SECONDS > 0:
+            return HEDGE_AFTER_SECONDS
+        return max(2.0, self.latency(HEDGE_QUANTILE))
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            data = {
+                "outcomes": list(self.outcomes),
+                "latencies": [round(x, 3) for x in self.latencies],
+                "consecutiveFailures": self.consecutive_failures,
+                "lastFailureStatus": self.last_failure_status,
+                "lastFailureAt": self.last_failure_at,
+                "cooldownUntil": self.cooldown_until,
+                "openCount": self.open_count,
+            }
+        # Summary fields are informational; they are recomputed from the windows on load
+        data["successRate"] = round(self.success_rate(), 3)
+        data["p50"] = round(self.latency(0.5), 2)
+        data["p95"] = round(self.latency(0.95), 2)
+        return data
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict):
+        stats = cls(name)
+        stats.outcomes.extend(bool(x) for x in data.get("outcomes", []))
+        stats.latencies.extend(data.get("latencies", []))
+        stats.consecutive_failures = data.get("consecutiveFailures", 0)
+        stats.last_failure_status = data.get("lastFailureStatus")
+        stats.last_failure_at = data.get("lastFailureAt")
+        stats.cooldown_until = data.get("cooldownUntil", 0.0)
+        stats.open_count = data.get("openCount", 0)
+        return stats
+
+provider_stats = None
+_provider_stats_lock = threading.Lock()
+_proxy_executor = None
+
+def load_provider_health():
+    """Load the persisted scoreboard so a run starts from the previous run's knowledge."""
+    global provider_stats
+    provider_stats = {}
+    try:
+        if os.path.exists(PROVIDER_HEALTH_PATH):
+            with open(PROVIDER_HEALTH_PATH, "r", encoding="utf-8") as f:
+                for name, data in json.load(f).items():
+                    provider_stats[name] = ProviderStats.from_dict(name, data)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Failed to load provider health from {PROVIDER_HEALTH_PATH}: {e}", file=sys.stderr)
+
+def save_provider_health():
+    with _provider_stats_lock:
+        if provider_stats is None:
+            return
+        snapshot = {name: stats.to_dict() for name, stats in provider_stats.items()}
+    try:
+        temp_path = f"{PROVIDER_HEALTH_PATH}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(temp_path, PROVIDER_HEALTH_PATH)
+    except OSError as e:
+        print(f"Warning: Failed to save provider health: {e}", file=sys.stderr)
+
+def get_provider_stats(name: str) -> ProviderStats:
+    with _provider_stats_lock:
+        if provider_stats is None:
+            load_provider_health()
+        if name not in provider_stats:
+            provider_stats[name] = ProviderStats(name)
+        return provider_stats[name]
+
+def print_provider_health():
+    if not provider_stats:
+        return
+    print("Backend health:")
+    for name, stats in sorted(provider_stats.items()):
+        state = "open" if stats.open_count else "closed"
+        if stats.open_count and time.time() >= stats.cooldown_until:
+            state = "half-open"
+        print(
+            f"  {name:<12} success {stats.success_rate():.0%}  p50 {stats.latency(0.5):.1f}s  "
+            f"p95 {stats.latency(0.95):.1f}s  last failure {stats.last_failure_status}  circuit {state}"
+        )
+
+def backend_ok(content, status_code: int) -> bool:
+    """Whether a backend did its job, independent of whether the page exists."""
+    if status_code == 200:
+        return bool(content)
+    return status_code in BACKEND_HEALTHY_STATUSES
+
+def _timed_proxy_call(provider: str, fetch_via, url: str, headers: dict):
+    start = time.monotonic()
+    try:
+        content, status_code, resp_headers = fetch_via(url, headers)
+    except Exception as e:
+        print(f"{provider} request error: {e}", file=sys.stderr)
+        content, status_code, resp_headers = None, 0, {}
+    get_provider_stats(provider).record(backend_ok(content, status_code), time.monotonic() - start, status_code)
+    return content, status_code, resp_headers
+
+def race_proxies(url: str, proxies: dict, headers: dict = None):
+    """Fetch `url` through the proxy backends in order of expected cost.
+
+    Backends with an open circuit are skipped. If the current backend has not
+    answered within its tail latency, the next one is started as a hedge and
+    whichever succeeds first wins. A failed backend hands over to the next one
+    immediately. Returns (provider, content, status, headers) or None if every
+    backend failed.
+    """
+    global _proxy_executor
+    with _provider_stats_lock:
+        if _proxy_executor is None:
+            _proxy_executor = ThreadPoolExecutor(
+                max_workers=max(1, CRAWL_CONCURRENCY) * len(PROXY_CREDITS),
+                thread_name_prefix="proxy",
+            )
+    remaining = sorted(proxies, key=lambda name: get_provider_stats(name).score())
+    pending = {}
+    latest = None
+
+    def launch():
+        nonlocal latest
+        while remaining:
+            provider = remaining.pop(0)
+            if get_provider_stats(provider).allow_request():
+                latest = provider
+                future = _proxy_executor.submit(_timed_proxy_call, provider, proxies[provider], url, headers)
+                pending[future] = provider
+                return True
+        return False
 
-    if cache_valid(path, ttl_hours):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f), True
+    launch()
+    while pending:
+        timeout = get_provider_stats(latest).hedge_delay() if remaining else None
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            print(f"{latest} slower than {timeout:.0f}s for {url}, hedging...")
+            launch()
+            continue
+        for future in done:
+            provider = pending.pop(future)
+            content, status_code, resp_headers = future.result()
+            if (status_code == 200 and content) or status_code == 304:
+                # Slower backends still running finish in the background and only update their stats
+                return provider, content, status_code, resp_headers
+        if not pending:
+            launch()
+    return None
+
+def fetch_cached(url: str, ttl_hours: int = None):
+    """Return a cached page regardless of its age without touching the network; used by --reparse."""
+    if cache_lookup(url) is None:
+        return None, False
+    data = cache_read(url)
+    return data, data is not None
+
+def store_page(url: str, status_code: int, html: str, headers, defer: bool = False) -> dict:
+    """Cache a downloaded page and return its entry.
+
+    With `defer` in payload mode the page is returned as raw HTML instead, so
+    the expensive reduction runs in a parser process; parse_page() builds the
+    entry there and the crawling process writes it with the saved validators.
+    """
+    if defer and CACHE_MODE == "payload":
+        etag, last_modified = response_validators(headers)
+        validators = {k: v for k, v in (("ETag", etag), ("Last-Modified", last_modified)) if v}
+        return {
+            "url": url,
+            "status": status_code,
+            "fetchedAt": datetime.now(timezone.utc).isoformat(),
+            "html": html,
+            "pendingCache": validators,
+        }
+    data = page_entry(url, status_code, html)
+    cache_write(url, data, headers=headers)
+    return data
+
+def fetch(url: str, ttl_hours: int = None, defer_cache: bool = False):
+    entry = cache_lookup(url)
+    if entry is not None and entry_fresh(entry, ttl_hours):
+        data = cache_read(url)
+        if data is not None:
+            cache_mark_hit(url)
+            return data, True
+
+    # An expired entry with validators is revalidated instead of re-downloaded
+    validators = conditional_headers(entry)
 
     # === Playwright Path (preferred local) ===
-    if USE_PLAYWRIGHT:
-        content, status_code = fetch_via_playwright(url)
+    if USE_PLAYWRIGHT and get_provider_stats("playwright").allow_request():
+        start = time.monotonic()
+        content, status_code, headers = fetch_via_playwright(url)
+        get_provider_stats("playwright").record(backend_ok(content, status_code), time.monotonic() - start, status_code)
         if content and status_code == 200:
-            data = {
-                "url": url,
-                "status": status_code,
-                "fetchedAt": datetime.now(timezone.utc).isoformat(),
-                "html": content
-            }
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False)
-            time.sleep(random.uniform(2.0, 4.0))
-            return data, False
+            return store_page(url, status_code, content, headers, defer_cache), False
         print(f"Warning: Playwright failed for {url}. Falling through to other strategies.", file=sys.stderr)
 
     # === Proxy API Path (used in CI) ===
-    # Try ZenRows first (most reliable for Cloudflare), then ScrapingBee, then ScraperAPI
-    proxy_result = None
-
-    if ZENROWS_API_KEY:
-        content, status_code = fetch_via_zenrows(url)
-        if content and status_code == 200:
-            proxy_result = (content, status_code)
-    
-    if not proxy_result and SCRAPINGBEE_API_KEY:
-        content, status_code = fetch_via_scrapingbee(url)
-        if content and status_code == 200:
-            proxy_result = (content, status_code)
-            
-    if not proxy_result and SCRAPINGANT_API_KEY:
-        content, status_code = fetch_via_scrapingant(url)
-        if content and status_code == 200:
-            proxy_result = (content, status_code)
-            
-    if not proxy_result and SCRAPER_API_KEY:
-        content, status_code = fetch_via_scraperapi(url)
-        if content and status_code == 200:
-            proxy_result = (content, status_code)
-            
+    # Backends are raced in order of expected cost; see race_proxies
+    proxies = {
+        provider: fetch_via
+        for provider, api_key, fetch_via in [
+            ("zenrows", ZENROWS_API_KEY, fetch_via_zenrows),
+            ("scrapingbee", SCRAPINGBEE_API_KEY, fetch_via_scrapingbee),
+            ("scrapingant", SCRAPINGANT_API_KEY, fetch_via_scrapingant),
+            ("scraperapi", SCRAPER_API_KEY, fetch_via_scraperapi),
+        ]
+        if api_key
+    }
+    proxy_result = race_proxies(url, proxies, validators) if proxies else None
     if proxy_result:
-        content, status_code = proxy_result
-        data = {
-            "url": url,
-            "status": status_code,
-            "fetchedAt": datetime.now(timezone.utc).isoformat(),
-            "html": content
-        }
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False)
-        time.sleep(random.uniform(2.0, 4.0))  # Polite delay
-        return data, False
+        provider, content, status_code, headers = proxy_result
+        if status_code == 304:
+            return not_modified(url, provider)
+        return store_page(url, status_code, content, headers, defer_cache), False
 
     if SCRAPER_API_KEY or SCRAPINGBEE_API_KEY or ZENROWS_API_KEY or SCRAPINGANT_API_KEY:
         print(f"Warning: All proxy services failed for {url}. Falling back to direct fetch.", file=sys.stderr)
@@ -389,9 +1325,19 @@ def fetch(url: str, ttl_hours: int = None):
     max_retries = 4 # Increased retries
     base_delay = 10
     
-    session = get_session()
+    # The direct fetch is the last backend, so it is never skipped: an open
+    # circuit only puts the plain backoff in front of the first attempt
+    direct = get_provider_stats("direct")
+    if not direct.allow_request():
+        wait_time = base_delay + random.uniform(5, 15)
+        print(f"Direct circuit open; fetching {url} in {wait_time:.1f}s.", file=sys.stderr)
+        time.sleep(wait_time)
 
     for attempt in range(max_retries + 1):
+        session = session_pool.lease()
+        blocked = False
+        wait_time = 0
+        start = time.monotonic()
         try:
             print(f"Fetching {url} (Attempt {attempt + 1})...")
             
@@ -402,203 +1348,552 @@ def fetch(url: str, ttl_hours: int = None):
             }
             if "page=" in url:
                 resp_headers["Referer"] = url.split("page=")[0]
+            resp_headers.update(validators)
                 
+            throttle(url)
             response = session.get(url, headers=resp_headers)
             status_code = response.status_code
             content = response.text
+
+            if status_code == 304 and validators:
+                direct.record(True, time.monotonic() - start, status_code)
+                return not_modified(url)
             
             # Check for Cloudflare block in content
             if any(term in content for term in ["Just a moment", "Attention Required", "Verify you are human", "Cloudflare", "Access denied", "Checking your browser"]):
                 print(f"Cloudflare challenge detected on {url}.", file=sys.stderr)
                 status_code = 403
 
-            if status_code == 200:
-                data = {
-                    "url": url,
-                    "status": status_code,
-                    "fetchedAt": datetime.now(timezone.utc).isoformat(), # UTC isoformat
-                    "html": content
-                }
+            # Blocks stick to a session's fingerprint: the session is retired so the
+            # retry leases another warm one, and the backend's circuit is left alone
+            blocked = status_code in (403, 429)
+            if blocked:
+                direct.release_probe()
+            else:
+                direct.record(backend_ok(content, status_code), time.monotonic() - start, status_code)
 
-                with open(path, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False)
-                
-                # Jittered delay
-                jitter = random.uniform(5.0, 10.0) # Increased jitter
-                time.sleep(DELAY_SECONDS + jitter)
-                return data, False
+            if status_code == 200:
+                return store_page(url, status_code, content, response.headers, defer_cache), False
 
             # Handle 403/429/5xx with backoff
-            if status_code in (403, 429, 500, 502, 503, 504):
-                if attempt < max_retries:
-                    wait_time = (base_delay * (2.5 ** attempt)) + random.uniform(5, 15)
-                    print(f"Server returned {status_code} for {url}. Retrying in {wait_time:.1f}s...", file=sys.stderr)
-                    
-                    # If 403, try to refresh the home page to "reset"
-                    if status_code in (403, 429):
-                        try:
-                            # Use a wider variety of profiles, prioritizing newer ones
-                            profiles = ["chrome124", "chrome120", "chrome116", "safari17_0", "edge101"]
-                            profile = random.choice(profiles)
-                            print(f"Creating new session on retry with profile: {profile}", file=sys.stderr)
-                            new_session = requests.Session(impersonate=profile, timeout=60)
-                            
-                            # Re-add headers with same-origin for the home page retry visit
-                            new_session.headers.update({
-                                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-                                "Accept-Language": "sv-SE,sv;q=0.9,en-US;q=0.8,en;q=0.7",
-                                "Referer": "https://www.google.se/",
-                                "Sec-Fetch-Dest": "document",
-                                "Sec-Fetch-Mode": "navigate",
-                                "Sec-Fetch-Site": "cross-site",
-                                "Sec-Fetch-User": "?1",
-                                "Upgrade-Insecure-Requests": "1"
-                            })
-                            
-                            # For Chrome, add CH headers
-                            if profile.startswith("chrome"):
-                                v = profile.replace("chrome", "")
-                                new_session.headers.update({
-                                    "sec-ch-ua": f'"Chromium";v="{v}", "Google Chrome";v="{v}", "Not-A.Brand";v="99"',
-                                    "sec-ch-ua-mobile": "?0",
-                                    "sec-ch-ua-platform": '"Windows"'
-                                })
-                            
-                            resp = new_session.get("https://www.booli.se/")
-                            if resp.status_code != 200:
-                                print(f"Warning: Session reset home page returned status {resp.status_code}", file=sys.stderr)
-                            
-                            time.sleep(random.uniform(5.0, 10.0)) # Slightly longer wait
-                            global _session
-                            _session = new_session 
-                            session = new_session
-                        except Exception as e:
-                            print(f"Failed to reset session: {e}", file=sys.stderr)
-                        
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    print(f"Failed after {max_retries} retries for {url}. Status: {status_code}", file=sys.stderr)
-                    return None, False
-            
-            return None, False
+            if status_code not in (403, 429, 500, 502, 503, 504):
+                return None, False
+            if attempt == max_retries:
+                print(f"Failed after {max_retries} retries for {url}. Status: {status_code}", file=sys.stderr)
+                return None, False
+
+            if status_code == 403:
+                wait_time = random.uniform(1.0, 3.0)
+            else:
+                wait_time = (base_delay * (2.5 ** attempt)) + random.uniform(5, 15)
+            print(f"Server returned {status_code} for {url}. Retrying in {wait_time:.1f}s...", file=sys.stderr)
             
         except Exception as e:
-            if attempt < max_retries:
-                wait_time = (base_delay * (2 ** attempt)) + random.uniform(0, 2)
-                print(f"Request failed ({e}) for {url}. Retrying in {wait_time:.1f}s...", file=sys.stderr)
-                time.sleep(wait_time)
-            else:
+            direct.record(False, time.monotonic() - start, 0)
+            if attempt == max_retries:
                 print(f"Request failed after {max_retries} retries for {url}: {e}", file=sys.stderr)
                 return None, False
+            wait_time = (base_delay * (2 ** attempt)) + random.uniform(0, 2)
+            print(f"Request failed ({e}) for {url}. Retrying in {wait_time:.1f}s...", file=sys.stderr)
+        finally:
+            if blocked:
+                session_pool.retire(session)
+            else:
+                session_pool.release(session)
+
+        time.sleep(wait_time)
 
     return None, False
 
+# =====================
+# TAG MATCHING
+# =====================
+# Property tags found in listing text. Each tag has word patterns (regex
+# fragments matched as whole words, case-insensitive), optional negations that
+# suppress the tag when found anywhere in the text, and optional tags that make
+# it redundant. TAG_VOCABULARY_PATH may hold a JSON object in the same shape;
+# its entries are added after (or replace) the built-in ones, e.g.
+#   {"Fiber": {"patterns": ["fiber", "bredband"]}}
+TAG_VOCABULARY = {
+    "Gavelläge": {"patterns": ["gavelläge"]},
+    "Hörnläge": {"patterns": ["hörnläge"]},
+    "Eldstad": {"patterns": ["eldstad", "kamin", "kakelugn", "öppen spis"]},
+    "Hiss": {"patterns": ["hiss"], "negations": [r"Hiss\s+(?:saknas|finns ej|nej)"]},
+    "Parkering": {"patterns": ["parkering", "p-plats", "garage"]},
+    "Bastu": {"patterns": ["bastu"]},
+    "Inglasad balkong": {"patterns": ["inglasad balkong"]},
+    "Balkong": {"patterns": ["balkong"], "excludedBy": ["Inglasad balkong"]},
+    "Uteplats": {"patterns": ["uteplats"]},
+    "Sekelskifte": {"patterns": ["sekelskifte"]},
+    "Nyproduktion": {"patterns": ["nyproduktion"]},
+    "Laddstolpe": {"patterns": ["laddstolpe", "elbilsladdare"]},
+    "Toppvåning": {"patterns": ["toppvåning", "högst upp", "översta våningen"]},
+}
+
+class TagMatcher:
+    """Finds every tag of a vocabulary in one pass over a text.
+
+    All word patterns are compiled into a single alternation anchored at word
+    starts, inside a lookahead so overlapping hits are all seen. The
+    alternation reports one tag per position, so at each hit the tags after
+    it are also tried there. Negations are only searched for tags that were hit.
+    """
+    def __init__(self, vocabulary: dict):
+        self.vocabulary = vocabulary
+        self.tags = list(vocabulary)
+        self.patterns = []
+        self.negations = {}
+        alternatives = []
+        for i, (tag, spec) in enumerate(vocabulary.items()):
+            words = f"(?:{'|'.join(spec['patterns'])})\\b"
+            alternatives.append(f"(?P<g{i}>{words})")
+            self.patterns.append(re.compile(words, re.IGNORECASE))
+            if spec.get("negations"):
+                self.negations[tag] = re.compile("|".join(spec["negations"]), re.IGNORECASE)
+        self.regex = re.compile(f"\\b(?=(?:{'|'.join(alternatives)}))", re.IGNORECASE) if alternatives else None
+
+    def find(self, text: str) -> list:
+        """Tags present in `text`, in vocabulary order."""
+        found = set()
+        if self.regex is not None:
+            for match in self.regex.finditer(text):
+                first = int(match.lastgroup[1:])
+                found.add(first)
+                # Earlier alternatives already failed here; later ones may match too
+                for i in range(first + 1, len(self.tags)):
+                    if i not in found and self.patterns[i].match(text, match.start()):
+                        found.add(i)
+        found = {self.tags[i] for i in found}
+        tags = []
+        for tag, spec in self.vocabulary.items():
+            if tag not in found or any(t in tags for t in spec.get("excludedBy", [])):
+                continue
+            if tag in self.negations and self.negations[tag].search(text):
+                continue
+            tags.append(tag)
+        return tags
+
+def valid_tag_spec(tag, spec) -> bool:
+    """Whether a vocabulary entry has the shape TagMatcher needs; warns about the problem otherwise."""
+    problem = None
+    if not isinstance(spec, dict):
+        problem = "entry is not an object"
+    elif not spec.get("patterns") or not isinstance(spec["patterns"], list):
+        problem = 'missing a non-empty "patterns" list'
+    else:
+        for key in ("patterns", "negations", "excludedBy"):
+            values = spec.get(key, [])
+            if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+                problem = f'"{key}" must be a list of strings'
+                break
+        else:
+            try:
+                for key in ("patterns", "negations"):
+                    for pattern in spec.get(key, []):
+                        re.compile(pattern)
+            except re.error as e:
+                problem = f"bad pattern {pattern!r}: {e}"
+    if problem:
+        print(f"Warning: Ignoring tag {tag!r} in tag vocabulary: {problem}", file=sys.stderr)
+    return problem is None
+
+def load_tag_vocabulary(path: str = TAG_VOCABULARY_PATH) -> dict:
+    """The built-in vocabulary merged with the valid entries of the JSON file at `path`, if any."""
+    vocabulary = dict(TAG_VOCABULARY)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                extra = json.load(f)
+            if not isinstance(extra, dict):
+                raise ValueError("expected a JSON object of tags")
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read tag vocabulary {path}: {e}", file=sys.stderr)
+        else:
+            vocabulary.update((tag, spec) for tag, spec in extra.items() if valid_tag_spec(tag, spec))
+    return vocabulary
+
+tag_matcher = TagMatcher(load_tag_vocabulary())
+
+# =====================
+# DATA POINTS
+# =====================
+# displayAttributes.dataPoints are classified by one table. A point whose `key`
+# names a rule goes straight to it; any other point is offered to the rules in
+# order and the first whose words occur in its text claims it. A rule marked
+# `once` is skipped while its field is already set.
+NUMBER_RE = re.compile(r'(\d+(?:[.,]\d+)?)')
+PLOT_AREA_RE = re.compile(r'([\d\s]+)\s*(?:m²|kvm|m2)', re.IGNORECASE)
+RENT_RE = re.compile(r'([\d\s]+)\s*kr/mån', re.IGNORECASE)
+TOTAL_FLOORS_RE = re.compile(r'(?:av|/)\s*(\d+)')
+YEAR_RE = re.compile(r'(\d{4})')
+
+def _decimal(txt: str):
+    match = NUMBER_RE.search(txt)
+    return float(match.group(1).replace(",", ".")) if match else None
+
+def _digits(txt: str):
+    digits = "".join(c for c in txt if c.isdigit())
+    try:
+        return int(digits) if digits else None
+    except ValueError:  # isdigit() also accepts "²"
+        return None
+
+def _parse_plot_area(txt, lower):
+    match = PLOT_AREA_RE.search(txt)
+    plot_area = _digits(match.group(1)) if match else None
+    return {"plotArea": plot_area} if plot_area is not None else {}
+
+def _parse_rent(txt, lower):
+    # "1 958 kr/mån"; otherwise any number of at most 5 digits next to "avgift"
+    match = RENT_RE.search(txt)
+    if match:
+        rent = _digits(match.group(1))
+    elif sum(c.isdigit() for c in txt) <= 5:
+        rent = _digits(txt)
+    else:
+        rent = None
+    return {"rent": rent} if rent is not None else {}
+
+def _parse_operating_cost(txt, lower):
+    # Often given as "XXXX kr/år"; typical house operating cost is 20k-60k/year
+    value = _digits(txt)
+    if value is None:
+        return {}
+    return {"operatingCost": value / 12 if "år" in lower or value > 5000 else value}
+
+def _parse_floor(txt, lower):
+    # "vån 3", "3 tr", "½ tr", "BV" (bottenvåning); total floors from "3 av 5" or "3/5"
+    fields = {}
+    if lower == "bv" or "bottenvåning" in lower:
+        fields["floor"] = 0
+    else:
+        match = NUMBER_RE.search(txt)
+        if match:
+            fields["floor"] = int(float(match.group(1).replace(",", ".")))
+    match = TOTAL_FLOORS_RE.search(txt)
+    if match:
+        fields["totalFloors"] = int(match.group(1))
+    return fields
+
+def _decimal_field(field):
+    def parse(txt, lower):
+        value = _decimal(txt)
+        return {field: value} if value is not None else {}
+    return parse
+
+# (field, point keys, words that claim a point by its text, once, parser)
+DATA_POINT_RULES = [
+    ("rooms", ("rooms",), lambda l: "rum" in l or "rok" in l, True, _decimal_field("rooms")),
+    ("livingArea", ("livingArea",), lambda l: "m²" in l or "kvm" in l or "boarea" in l or "m2" in l, True, _decimal_field("livingArea")),
+    ("secondaryArea", ("additionalArea", "secondaryArea"), lambda l: "biarea" in l or "bi-area" in l, True, _decimal_field("secondaryArea")),
+    ("plotArea", ("plotArea",), lambda l: ("tomt" in l) and ("m²" in l or "kvm" in l or "m2" in l), False, _parse_plot_area),
+    ("rent", ("rent",), lambda l: ("kr/mån" in l or "avgift" in l) and "kr/m²" not in l and "m2" not in l, True, _parse_rent),
+    ("operatingCost", ("operatingCost",), lambda l: ("drift" in l or "kr/år" in l) and "kr/m²" not in l, False, _parse_operating_cost),
+    ("floor", ("floor",), lambda l: "vån" in l or " tr" in l or l == "bv", True, _parse_floor),
+]
+DATA_POINT_RULES_BY_KEY = {key: rule for rule in DATA_POINT_RULES for key in rule[1]}
+
+def parse_data_points(points, resolver) -> dict:
+    """Fields read from displayAttributes data points, each point visited once."""
+    fields = {}
+    for pt in points:
+        pt = resolver.view(pt)
+        if not isinstance(pt, dict):
+            continue
+        val = pt.get("value") or {}
+        txt = val.get("plainText", "") or ""
+        lower = txt.lower()
+        key = pt.get("key") or ""
+
+        rule = DATA_POINT_RULES_BY_KEY.get(key)
+        if rule is None or (rule[3] and fields.get(rule[0])):
+            rule = next(
+                (r for r in DATA_POINT_RULES if not (r[3] and fields.get(r[0])) and r[2](lower)),
+                None,
+            )
+        if rule is not None:
+            fields.update(rule[4](txt, lower))
+
+        # Construction year can share a point with any rule above
+        suffix = val.get("suffix") or ""
+        if not fields.get("constructionYear") and (key == "constructionYear" or "byggår" in key.lower() or "år" in suffix):
+            match = YEAR_RE.search(txt)
+            if match:
+                fields["constructionYear"] = int(match.group(1))
+    return fields
+
 # =====================
 # PARSING
 # =====================
+# __NEXT_DATA__ is located with substring search and decoded by payload.py
+parse_next_data = payload.parse_next_data
+apollo_state = payload.apollo_state
+
+def strip_page(html: str) -> dict:
+    """Reduce a page to what the extractors read: Apollo state, visible text and pagination links."""
+    soup = BeautifulSoup(html, HTML_PARSER)
+    return {
+        "apollo": payload.parse_apollo_state(html),
+        "text": soup.get_text(),
+        "pageLinks": [a.get("href") for a in soup.select("a[href*='page=']") if a.get("href")],
+        "htmlBytes": len(html.encode("utf-8")),
+    }
+
+def page_entry(url: str, status_code: int, html: str) -> dict:
+    """Build the cache entry for a fetched page according to CACHE_MODE."""
+    data = {
+        "url": url,
+        "status": status_code,
+        "fetchedAt": datetime.now(timezone.utc).isoformat(),
+    }
+    if CACHE_MODE == "payload":
+        data.update(strip_page(html))
+    else:
+        data["html"] = html
+    return data
+
+def page_apollo(page):
+    """Apollo state of raw HTML or a cache entry; None when the page has no __NEXT_DATA__."""
+    if isinstance(page, dict):
+        if "apollo" in page:
+            return page["apollo"]
+        page = page.get("html", "")
+    return payload.parse_apollo_state(page)
+
+def page_next_data(page):
+    """__NEXT_DATA__ document of raw HTML or a cache entry (payload entries only keep the Apollo state)."""
+    if isinstance(page, dict):
+        if "apollo" in page:
+            return {"props": {"pageProps": {"__APOLLO_STATE__": page["apollo"]}}} if page["apollo"] is not None else None
+        page = page.get("html", "")
+    return parse_next_data(page)
+
+def page_text(page) -> str:
+    """Visible text of raw HTML or a cache entry."""
+    if isinstance(page, dict):
+        if "text" in page:
+            return page["text"]
+        page = page.get("html", "")
+    return BeautifulSoup(page, HTML_PARSER).get_text()
+
+def page_links(page) -> list:
+    """hrefs of the pagination links of raw HTML or a cache entry."""
+    if isinstance(page, dict):
+        if "pageLinks" in page:
+            return page["pageLinks"]
+        page = page.get("html", "")
+    soup = BeautifulSoup(page, HTML_PARSER)
+    return [a.get("href") for a in soup.select("a[href*='page=']") if a.get("href")]
+
+class ApolloView(dict):
+    """Read-only view of an Apollo object whose fields resolve on first access.
+
+    Only the fields an extractor actually reads are resolved; each resolved
+    value is kept in place so later reads are plain dict lookups.
+    """
+    __slots__ = ("_resolver",)
+
+    def __init__(self, raw: dict, resolver):
+        super().__init__(raw)
+        self._resolver = resolver
+
+    def __reduce__(self):
+        # Pickle (e.g. back from a parser worker) as a plain, resolved dict
+        return dict, (dict(self.items()),)
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        resolved = self._resolver.view(value)
+        if resolved is not value:
+            dict.__setitem__(self, key, resolved)
+        return resolved
+
+    def get(self, key, default=None):
+        return self[key] if dict.__contains__(self, key) else default
+
+    def items(self):
+        return [(key, self[key]) for key in dict.keys(self)]
+
+    def values(self):
+        return [self[key] for key in dict.keys(self)]
+
+class ApolloResolver:
+    """Resolves the `__ref`s of one page's Apollo state, each reference at most once.
+
+    view() gives lazy ApolloView objects for extractors; resolve() builds plain
+    nested dicts. Both share nodes across listings (images, housing
+    associations, locations) and treat a reference back into a node that is
+    still being resolved as a cycle, leaving the `__ref` in place.
+    """
+    def __init__(self, state: dict):
+        self.state = state
+        self.views = {}
+        self.nodes = {}
+        self.active = set()
+
+    def view(self, obj):
+        if isinstance(obj, ApolloView) or not isinstance(obj, (dict, list)):
+            return obj
+        if isinstance(obj, list):
+            return [self.view(i) for i in obj]
+        ref = obj.get("__ref")
+        if ref is None:
+            return ApolloView(obj, self)
+        if ref not in self.views:
+            target = self.state.get(ref)
+            self.views[ref] = ApolloView(target, self) if isinstance(target, dict) else target
+        return self.views[ref]
+
+    def resolve(self, obj):
+        if isinstance(obj, list):
+            return [self.resolve(i) for i in obj]
+        if not isinstance(obj, dict):
+            return obj
+        ref = obj.get("__ref")
+        if ref is None:
+            return {k: self.resolve(v) for k, v in dict.items(obj)}
+        if ref in self.nodes:
+            return self.nodes[ref]
+        if ref in self.active:
+            return obj
+        self.active.add(ref)
+        try:
+            node = self.resolve(self.state.get(ref))
+        finally:
+            self.active.discard(ref)
+        self.nodes[ref] = node
+        return node
+
 def resolve(obj, state):
     """Resolve Apollo references recursivly."""
-    if isinstance(obj, dict) and "__ref" in obj:
-        return resolve(state.get(obj["__ref"]), state)
-    if isinstance(obj, list):
-        return [resolve(i, state) for i in obj]
-    if isinstance(obj, dict):
-        return {k: resolve(v, state) for k, v in obj.items()}
-    return obj
-
-def extract_objects(html: str, source_page: str):
-    # Use robust regex instead of soup.find as script.string can sometimes be None/truncated
-    import re
-    match = re.search(r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>', html, re.DOTALL)
+    return ApolloResolver(state).resolve(obj)
+
+def listing_text(obj) -> str:
+    """Text of a listing's own Apollo fields (descriptions, data points, amenities...).
+
+    Walks the listing and everything it references once, skipping URLs, so text
+    matching on a search page only sees that listing instead of the whole page.
+    """
+    parts = []
+    seen = set()
+    stack = [obj]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, str):
+            if not value.startswith(("http", "/")):
+                parts.append(value)
+        elif isinstance(value, (dict, list)):
+            if id(value) in seen:
+                continue
+            seen.add(id(value))
+            if isinstance(value, dict):
+                stack.extend(v for k, v in reversed(value.items()) if k != "__typename")
+            else:
+                stack.extend(reversed(value))
+    return "\n".join(parts)
+
+def search_results(apollo: dict, source_page: str) -> list:
+    """The search result objects in ROOT_QUERY that belong to the search at `source_page`."""
+    results = []
+    root = apollo.get("ROOT_QUERY", {})
     
-    if not match:
-        print(f"Warning: No __NEXT_DATA__ found on {source_page}", file=sys.stderr)
-        return []
+    is_sold_search = "/slutpriser" in source_page.lower()
+    
+    # Extract areaIds from source_page URL to verify
+    p_src = urllib.parse.urlparse(source_page)
+    qs_src = urllib.parse.parse_qs(p_src.query)
+    src_area_ids = qs_src.get("areaIds", [])
+    src_area_ids = [aid.strip() for aids in src_area_ids for aid in aids.split(",")]
+    
+    for k, v in root.items():
+        valid_key = False
+        if is_sold_search:
+            if k.startswith("searchSold"): valid_key = True
+        else:
+            if k.startswith("searchForSale") or k.startswith("searchNyproduktion"): valid_key = True
+            
+        # Safeguard: check that the query key matches our search area if areaIds are specified
+        if valid_key and src_area_ids:
+            try:
+                start_idx = k.find("(")
+                end_idx = k.rfind(")")
+                if start_idx != -1 and end_idx != -1:
+                    query_args = json.loads(k[start_idx+1:end_idx])
+                    inp = query_args.get("input", {})
+                    # areaId can be a string or list
+                    q_area_id = inp.get("areaId", "")
+                    if not q_area_id:
+                        q_area_id = query_args.get("areaId", "")
+                    
+                    if q_area_id:
+                        q_aids = [a.strip() for a in str(q_area_id).split(",")]
+                        # Only keep valid key if there is an intersection
+                        if not any(aid in q_aids for aid in src_area_ids):
+                            valid_key = False
+                    else:
+                        # If no areaId in the query key, it's not the main search
+                        valid_key = False
+            except Exception:
+                # Fallback to simple substring check if JSON parsing fails
+                if not any(aid in k for aid in src_area_ids):
+                    valid_key = False
+                    
+        if valid_key:
+            search_data = v
+            if isinstance(v, dict) and "__ref" in v:
+                search_data = apollo.get(v["__ref"], {})
+            
+            if isinstance(search_data, dict):
+                results.append(search_data)
+
+    return results
 
+def extract_objects(page, source_page: str):
+    """Extract listings from a page given as raw HTML or as a cache entry from fetch()."""
     try:
-        data = json.loads(match.group(1))
-        page_props = data.get("props", {}).get("pageProps", {})
-        apollo = page_props.get("__APOLLO_STATE__", {})
-        
-        if not apollo:
-            # Try alternative location
-            apollo = page_props.get("apolloState", {})
-        if not apollo:
-            # Try top-level props
-            apollo = data.get("props", {}).get("__APOLLO_STATE__", {})
+        apollo = page_apollo(page)
+        if apollo is None:
+            print(f"Warning: No __NEXT_DATA__ found on {source_page}", file=sys.stderr)
+            return []
         
         if not apollo:
              print(f"Warning: No Apollo state found in __NEXT_DATA__ on {source_page}", file=sys.stderr)
              return []
         
+        # Visible page text for the regex fallbacks, parsed at most once per page
+        parsed_text = []
+        def lazy_text():
+            if not parsed_text:
+                parsed_text.append(page_text(page))
+            return parsed_text[0]
+
+        # Tags of the page text, matched at most once per page
+        matched_tags = []
+        def lazy_tags():
+            if not matched_tags:
+                matched_tags.append(tag_matcher.find(lazy_text()))
+            return list(matched_tags[0])
+
         # 1. Find all listing IDs that are actually part of the search results
         # This avoids picking up "Recommended" or "Similar" listings.
         valid_refs = set()
-        root = apollo.get("ROOT_QUERY", {})
-        
-        is_sold_search = "/slutpriser" in source_page.lower()
-        
-        # Extract areaIds from source_page URL to verify
-        p_src = urllib.parse.urlparse(source_page)
-        qs_src = urllib.parse.parse_qs(p_src.query)
-        src_area_ids = qs_src.get("areaIds", [])
-        src_area_ids = [aid.strip() for aids in src_area_ids for aid in aids.split(",")]
-        
-        for k, v in root.items():
-            valid_key = False
-            if is_sold_search:
-                if k.startswith("searchSold"): valid_key = True
-            else:
-                if k.startswith("searchForSale") or k.startswith("searchNyproduktion"): valid_key = True
-                
-            # Safeguard: check that the query key matches our search area if areaIds are specified
-            if valid_key and src_area_ids:
-                try:
-                    start_idx = k.find("(")
-                    end_idx = k.rfind(")")
-                    if start_idx != -1 and end_idx != -1:
-                        query_args = json.loads(k[start_idx+1:end_idx])
-                        inp = query_args.get("input", {})
-                        # areaId can be a string or list
-                        q_area_id = inp.get("areaId", "")
-                        if not q_area_id:
-                            q_area_id = query_args.get("areaId", "")
-                        
-                        if q_area_id:
-                            q_aids = [a.strip() for a in str(q_area_id).split(",")]
-                            # Only keep valid key if there is an intersection
-                            if not any(aid in q_aids for aid in src_area_ids):
-                                valid_key = False
-                        else:
-                            # If no areaId in the query key, it's not the main search
-                            valid_key = False
-                except Exception:
-                    # Fallback to simple substring check if JSON parsing fails
-                    if not any(aid in k for aid in src_area_ids):
-                        valid_key = False
-                        
-            if valid_key:
-                search_data = v
-                if isinstance(v, dict) and "__ref" in v:
-                    search_data = apollo.get(v["__ref"], {})
-                
-                if isinstance(search_data, dict):
-                    res = search_data.get("result", [])
-                    if isinstance(res, list):
-                        for r in res:
-                            if isinstance(r, dict) and "__ref" in r:
-                                valid_refs.add(r["__ref"])
+        for search_data in search_results(apollo, source_page):
+            res = search_data.get("result", [])
+            if isinstance(res, list):
+                for r in res:
+                    if isinstance(r, dict) and "__ref" in r:
+                        valid_refs.add(r["__ref"])
 
         results = []
+        resolver = ApolloResolver(apollo)
         # 2. Only process items that are in the valid_refs set
         for key in valid_refs:
             item = apollo.get(key)
             if not item: continue
             
             if key.startswith("Listing:") or key.startswith("SoldProperty:") or key.startswith("Project:"):
-                # item is the listing object, but might have refs
-                obj = resolve(item, apollo)
+                # item is the listing object, but might have refs; fields resolve as they are read
+                obj = resolver.view(item)
                 
                 # URL & ID Logic
                 relative_url = obj.get("url")
@@ -609,7 +1904,6 @@ def extract_objects(html: str, source_page: str):
                     if not booli_id:
                         # try to extract from url /annons/123 or /bostad/123
                         # usually /bostad/123
-                        import re
                         match = re.search(r'/(\d+)$', relative_url)
                         if match:
                             booli_id = match.group(1)
@@ -674,121 +1968,51 @@ def extract_objects(html: str, source_page: str):
                             display_attrs = v
                             break
                             
+                point_fields = {}
                 if isinstance(display_attrs, dict):
-                    points = display_attrs.get("dataPoints", [])
-                    for pt in points:
-                         pt = resolve(pt, apollo)
-                         val_obj = pt.get("value", {})
-                         txt = val_obj.get("plainText", "")
-                         lower_txt = txt.lower()
-                         
-                         if ("rum" in lower_txt or "rok" in lower_txt) and not rooms:
-                             # Extract 3.5 from "3,5 rum"
-                             match = re.search(r'(\d+(?:[.,]\d+)?)', txt)
-                             if match:
-                                 try:
-                                     rooms = float(match.group(1).replace(",", "."))
-                                 except ValueError: pass
-                         elif ("m²" in lower_txt or "kvm" in lower_txt or "boarea" in lower_txt or "m2" in lower_txt) and not livingArea:
-                             match = re.search(r'(\d+(?:[.,]\d+)?)', txt)
-                             if match:
-                                 try:
-                                     livingArea = float(match.group(1).replace(",", "."))
-                                 except ValueError: pass
-                         elif ("biarea" in lower_txt or "bi-area" in lower_txt) and not secondaryArea:
-                             match = re.search(r'(\d+(?:[.,]\d+)?)', txt)
-                             if match:
-                                 try:
-                                     secondaryArea = float(match.group(1).replace(",", "."))
-                                 except ValueError: pass
-                         elif ("tomt" in lower_txt or "tomtyta" in lower_txt or "tomtarea" in lower_txt) and ("m²" in lower_txt or "kvm" in lower_txt or "m2" in lower_txt):
-                             match = re.search(r'([\d\s]+)\s*(?:m²|kvm|m2)', txt, re.IGNORECASE)
-                             if match:
-                                 digits = "".join(c for c in match.group(1) if c.isdigit())
-                                 if digits:
-                                     try:
-                                         plotArea = int(digits)
-                                     except ValueError: pass
-                         elif (("kr/mån" in lower_txt or "avgift" in lower_txt) and "kr/m²" not in lower_txt and "m2" not in lower_txt) and not rent:
-                             # Match patterns like "1 958 kr/mån" - extract number before kr/mån
-                             match = re.search(r'([\d\s]+)\s*kr/mån', txt, re.IGNORECASE)
-                             if match:
-                                 digits = "".join(c for c in match.group(1) if c.isdigit())
-                                 if digits:
-                                     try:
-                                         rent = int(digits)
-                                     except ValueError: pass
-                             else:
-                                 # Fallback: just extract digits if avgift is in text
-                                 digits = "".join(c for c in txt if c.isdigit())
-                                 if digits and len(digits) <= 5:  # Max 5 digits for reasonable avgift
-                                     try:
-                                         rent = int(digits)
-                                     except ValueError: pass
-                         elif ("drift" in lower_txt or "kr/år" in lower_txt) and "kr/m²" not in lower_txt:
-                             # Extract drift cost. Often given as "XXXX kr/år"
-                             digits = "".join(c for c in txt if c.isdigit())
-                             if digits:
-                                 try:
-                                     val = int(digits)
-                                     # If it's a house and we see a large value, it's definitely yearly.
-                                     # Typical house operating cost is 20k-60k/year.
-                                     if "år" in lower_txt or val > 5000: 
-                                         operatingCost = val / 12
-                                     else:
-                                         operatingCost = val
-                                 except ValueError: pass
-                         elif ("vån" in lower_txt or " tr" in lower_txt or lower_txt == "bv") and not floor:
-                             # Parse floor: "vån 3", "3 tr", "½ tr", "BV" (bottenvåning)
-                             if lower_txt == "bv" or "bottenvåning" in lower_txt:
-                                 floor = 0
-                             else:
-                                 match = re.search(r'(\d+(?:[.,]\d+)?)', txt)
-                                 if match:
-                                     try:
-                                         floor = int(float(match.group(1).replace(",", ".")))
-                                     except ValueError: pass
-                             
-                             # Extract total_floors from "3 av 5" or "3/5"
-                             match_tot = re.search(r'(?:av|/)\s*(\d+)', txt)
-                             if match_tot:
-                                 try:
-                                     total_floors = int(match_tot.group(1))
-                                 except ValueError: pass
+                    point_fields = parse_data_points(display_attrs.get("dataPoints") or [], resolver)
+                    rooms = point_fields.get("rooms")
+                    livingArea = point_fields.get("livingArea")
+                    secondaryArea = point_fields.get("secondaryArea")
+                    plotArea = point_fields.get("plotArea")
+                    rent = point_fields.get("rent")
+                    operatingCost = point_fields.get("operatingCost")
+                    floor = point_fields.get("floor")
+                    total_floors = point_fields.get("totalFloors")
 
                 # Fallback to direct fields if displayAttributes was missing or incomplete
                 if rooms is None:
-                    r_obj = resolve(obj.get("rooms"), apollo)
+                    r_obj = resolver.view(obj.get("rooms"))
                     if isinstance(r_obj, dict): rooms = r_obj.get("raw")
                     elif isinstance(r_obj, (int, float)): rooms = r_obj
                 
                 if livingArea is None:
-                    la_obj = resolve(obj.get("livingArea"), apollo)
+                    la_obj = resolver.view(obj.get("livingArea"))
                     if isinstance(la_obj, dict): livingArea = la_obj.get("raw")
                     elif isinstance(la_obj, (int, float)): livingArea = la_obj
                 
                 if rent is None:
-                    re_obj = resolve(obj.get("rent"), apollo)
+                    re_obj = resolver.view(obj.get("rent"))
                     if isinstance(re_obj, dict): rent = re_obj.get("raw")
                     elif isinstance(re_obj, (int, float)): rent = re_obj
                 
                 if floor is None:
-                    fl_obj = resolve(obj.get("floor"), apollo)
+                    fl_obj = resolver.view(obj.get("floor"))
                     if isinstance(fl_obj, dict): floor = fl_obj.get("raw")
                     elif isinstance(fl_obj, (int, float)): floor = fl_obj
                 
                 if total_floors is None:
-                    tf_obj = resolve(obj.get("totalFloors"), apollo)
+                    tf_obj = resolver.view(obj.get("totalFloors"))
                     if isinstance(tf_obj, dict): total_floors = tf_obj.get("raw")
                     elif isinstance(tf_obj, (int, float)): total_floors = tf_obj
 
                 if secondaryArea is None:
-                    sa_obj = resolve(obj.get("additionalArea"), apollo)
+                    sa_obj = resolver.view(obj.get("additionalArea"))
                     if isinstance(sa_obj, dict): secondaryArea = sa_obj.get("raw")
                     elif isinstance(sa_obj, (int, float)): secondaryArea = sa_obj
 
                 if plotArea is None:
-                    pa_obj = resolve(obj.get("plotArea"), apollo)
+                    pa_obj = resolver.view(obj.get("plotArea"))
                     if isinstance(pa_obj, dict): plotArea = pa_obj.get("raw")
                     elif isinstance(pa_obj, (int, float)): plotArea = pa_obj
 
@@ -798,12 +2022,12 @@ def extract_objects(html: str, source_page: str):
                 info_sections = obj.get("infoSections", [])
                 if isinstance(info_sections, list):
                     for section in info_sections:
-                        section = resolve(section, apollo)
+                        section = resolver.view(section)
                         content = section.get("content", {})
                         if isinstance(content, dict):
                             points = content.get("infoPoints", [])
                             for pt in points:
-                                pt = resolve(pt, apollo)
+                                pt = resolver.view(pt)
                                 key = pt.get("key")
                                 if key == "pageviews":
                                     # displayText: { markdown: "Bostaden har **261** sidvisningar på Booli" }
@@ -897,7 +2121,7 @@ def extract_objects(html: str, source_page: str):
                     is_sold = True
 
                 # Extract image URL
-                # The full object is already resolved by `resolve(item, apollo)` above.
+                # The listing view resolves references as they are read.
                 # On search pages: `primaryImage` is a resolved Image dict with an `id`.
                 # On detail pages: `images` is a resolved list of Image dicts.
                 image_url = None
@@ -941,27 +2165,15 @@ def extract_objects(html: str, source_page: str):
                 apartment_number = obj.get("apartmentNumber")
 
                 # Try to find in displayAttributes if missing
-                if not construction_year or not apartment_number:
-                    if isinstance(display_attrs, dict):
-                        points = display_attrs.get("dataPoints", [])
-                        for pt in points:
-                            pt = resolve(pt, apollo)
-                            val = pt.get("value", {})
-                            txt = val.get("plainText", "")
-                            
-                            if not construction_year and ("byggår" in pt.get("key", "").lower() or (val.get("suffix") and "år" in val.get("suffix"))):
-                                match = re.search(r'(\d{4})', txt)
-                                if match:
-                                    try: construction_year = int(match.group(1))
-                                    except: pass
+                if not construction_year:
+                    construction_year = point_fields.get("constructionYear")
                 
                 is_detail_page = "/bostad/" in source_page or "/annons/" in source_page
 
                 # Regex fallback for apartment number
                 if not apartment_number and is_detail_page:
                      try:
-                         soup = BeautifulSoup(html, "html.parser")
-                         text_content = soup.get_text()
+                         text_content = lazy_text()
                          lgh_match = re.search(r'(?:lgh|lägenhetsnummer)\s*:?\s*(\d{4})', text_content, re.IGNORECASE)
                          if lgh_match:
                              apartment_number = lgh_match.group(1)
@@ -970,8 +2182,7 @@ def extract_objects(html: str, source_page: str):
                 # Regex fallback for constructionYear
                 if not construction_year and is_detail_page:
                     try:
-                        soup = BeautifulSoup(html, "html.parser")
-                        text_content = soup.get_text()
+                        text_content = lazy_text()
                         year_match = re.search(r'(?:byggår|byggt)\s*:?\s*(\d{4})', text_content, re.IGNORECASE)
                         if year_match:
                              construction_year = int(year_match.group(1))
@@ -981,14 +2192,13 @@ def extract_objects(html: str, source_page: str):
                 brf_name = None
                 ha = obj.get("housingAssociation")
                 if isinstance(ha, dict):
-                    ha = resolve(ha, apollo)
+                    ha = resolver.view(ha)
                     brf_name = ha.get("name")
                 
                 # Fallback: Search for "Brf" or "Förening" in text
                 if not brf_name and is_detail_page:
                     try:
-                        soup = BeautifulSoup(html, "html.parser")
-                        text_content = soup.get_text()
+                        text_content = lazy_text()
                         brf_match = re.search(r'\b(?:Brf|Bostadsrättsföreningen)\s+[A-Za-zåäöÅÄÖ\s\d-]+(?:\b|\.)', text_content, re.IGNORECASE)
                         if brf_match:
                             brf_name = brf_match.group(0).strip().rstrip('.')
@@ -1002,8 +2212,7 @@ def extract_objects(html: str, source_page: str):
                 
                 if is_detail_page:
                     try:
-                        soup = BeautifulSoup(html, "html.parser")
-                        text_content = soup.get_text()
+                        text_content = lazy_text()
                         
                         apt_match = re.search(r'(?:Antal lägenheter|Lägenheter)\s*:?\s*(\d+)', text_content, re.IGNORECASE)
                         if apt_match:
@@ -1032,47 +2241,21 @@ def extract_objects(html: str, source_page: str):
                 # (Moved to displayAttributes parsing above to avoid matching random text on the search page)
 
                 # Extract Property Tags (Gavelläge, Eldstad, Hiss, etc.)
+                # A detail page shows one listing, so its whole text applies; on a search
+                # page only the listing's own Apollo fields do.
                 tags = []
                 try:
-                    soup = BeautifulSoup(html, "html.parser")
-                    text_content = soup.get_text()
-                    
-                    # Mapping of tag labels to regex patterns
-                    tag_patterns = {
-                        "Gavelläge": r'\bgavelläge\b',
-                        "Hörnläge": r'\bhörnläge\b',
-                        "Eldstad": r'\b(?:eldstad|kamin|kakelugn|öppen spis)\b',
-                        "Hiss": r'\bhiss\b',
-                        "Parkering": r'\b(?:parkering|p-plats|garage)\b',
-                        "Bastu": r'\bbastu\b',
-                        "Inglasad balkong": r'\binglasad balkong\b',
-                        "Balkong": r'\bbalkong\b',
-                        "Uteplats": r'\buteplats\b',
-                        "Sekelskifte": r'\bsekelskifte\b',
-                        "Nyproduktion": r'\bnyproduktion\b',
-                        "Laddstolpe": r'\b(?:laddstolpe|elbilsladdare)\b',
-                        "Toppvåning": r'\b(?:toppvåning|högst upp|översta våningen)\b'
-                    }
-                    
-                    for tag_name, pattern in tag_patterns.items():
-                        if re.search(pattern, text_content, re.IGNORECASE):
-                            # Special logic for Hiss: ensure it's not "Hiss saknas"
-                            if tag_name == "Hiss":
-                                if re.search(r'Hiss\s+(?:saknas|finns ej|nej)', text_content, re.IGNORECASE):
-                                    continue
-                            
-                            # Avoid duplicates (Balkong vs Inglasad balkong)
-                            if tag_name == "Balkong" and "Inglasad balkong" in tags:
-                                continue
-                                
-                            tags.append(tag_name)
-                            
+                    if is_detail_page:
+                        text_content = lazy_text()
+                        tags = lazy_tags()
+                    else:
+                        text_content = listing_text(obj)
+                        tags = tag_matcher.find(text_content)
                 except: pass
                 
                 # Extract Energy Class (restoring previous logic)
                 energy_class = None
                 try:
-                    # Reuse text_content if possible but soup might be needed
                     energy_match = re.search(r'(?:energiklass|energideklaration)\s*:?\s*([A-G])\b', text_content, re.IGNORECASE)
                     if energy_match:
                         energy_class = energy_match.group(1).upper()
@@ -1100,7 +2283,7 @@ def extract_objects(html: str, source_page: str):
                     "brokerAgency": obj.get("source", {}).get("name") if isinstance(obj.get("source"), dict) else (
                         next((v.get("name") for k, v in obj.items() if k.startswith("agency") and isinstance(v, dict)), None)
                     ),
-                    "nextShowing": obj.get("nextShowing"),
+                    "nextShowing": resolver.resolve(obj.get("nextShowing")),
                     "published": obj.get("published"),
                     "latitude": obj.get("latitude"),
                     "longitude": obj.get("longitude"),
@@ -1137,42 +2320,215 @@ def normalize_booli_url(url: str):
     new_query = urllib.parse.urlencode(filtered, doseq=True)
     return urllib.parse.urlunparse(parsed._replace(query=new_query, fragment=""))
 
-def find_pages(html: str, base_url: str):
-    soup = BeautifulSoup(html, "html.parser")
+def page_url(base_url: str, page_list) -> str:
+    """`base_url` with its page query parameter set to `page_list`."""
+    parsed_base = urllib.parse.urlparse(base_url)
+    new_qs = urllib.parse.parse_qs(parsed_base.query, keep_blank_values=True)
+    new_qs["page"] = page_list
+    new_query = urllib.parse.urlencode(new_qs, doseq=True)
+    full_url = urllib.parse.urlunparse((
+        parsed_base.scheme or "https",
+        parsed_base.netloc or "www.booli.se",
+        parsed_base.path,
+        parsed_base.params,
+        new_query,
+        parsed_base.fragment
+    ))
+    return normalize_booli_url(full_url)
+
+def plan_pages(page, base_url: str):
+    """All further page URLs of a search, from the hit count on its first page.
+
+    Returns None when the page carries no usable totalCount, so the caller can
+    fall back to find_pages().
+    """
+    apollo = page_apollo(page)
+    if not apollo:
+        return None
+    for search_data in search_results(apollo, base_url):
+        total = search_data.get("totalCount")
+        result = search_data.get("result")
+        if not isinstance(total, int) or not isinstance(result, list):
+            continue
+        page_count = search_data.get("pages")
+        if not isinstance(page_count, int):
+            if not result:
+                page_count = 1
+            else:
+                page_count = -(-total // len(result))
+        if MAX_PAGES_PER_SEARCH:
+            page_count = min(page_count, MAX_PAGES_PER_SEARCH)
+
+        current = urllib.parse.parse_qs(urllib.parse.urlparse(base_url).query).get("page", ["1"])[0]
+        current = int(current) if current.isdigit() else 1
+        return [page_url(base_url, [str(n)]) for n in range(current + 1, page_count + 1)]
+    return None
+
+def find_pages(page, base_url: str):
+    """Pagination URLs linked from a page given as raw HTML or as a cache entry."""
     pages = set()
     
-    parsed_base = urllib.parse.urlparse(base_url)
-    base_qs = urllib.parse.parse_qs(parsed_base.query, keep_blank_values=True)
-    base_path = parsed_base.path  # e.g., "/sok/till-salu"
+    base_path = urllib.parse.urlparse(base_url).path  # e.g., "/sok/till-salu"
     
-    for a in soup.select("a[href*='page=']"):
-        href = a.get("href")
-        if href and href.startswith(base_path):
+    for href in page_links(page):
+        if href.startswith(base_path):
             p = urllib.parse.urlparse(href)
             qs = urllib.parse.parse_qs(p.query, keep_blank_values=True)
             page_list = qs.get("page", [])
             if page_list:
                 # Merge base query parameters with the page number from pagination link
-                new_qs = base_qs.copy()
-                new_qs["page"] = page_list
-                new_query = urllib.parse.urlencode(new_qs, doseq=True)
-                full_url = urllib.parse.urlunparse((
-                    parsed_base.scheme or "https",
-                    parsed_base.netloc or "www.booli.se",
-                    parsed_base.path,
-                    parsed_base.params,
-                    new_query,
-                    parsed_base.fragment
-                ))
-                pages.add(normalize_booli_url(full_url))
+                pages.add(page_url(base_url, page_list))
 
     return sorted(pages)
 
+# =====================
+# SNAPSHOT
+# =====================
+# With a stream path, run() writes each object to a JSON Lines file as soon as
+# dedup accepts it, so a crash keeps what was crawled and memory stays flat;
+# finalize_snapshot() then builds the sorted snapshot from that file.
+def snapshot_sort_key(obj):
+    return obj["priceDiff"] if obj["priceDiff"] is not None else 10**12
+
+class SnapshotStream:
+    """Append-only JSON Lines file of accepted objects.
+
+    `resume` is the {"count", "bytes"} position of a checkpoint; the file is
+    cut back to it and appended to, dropping objects accepted after it.
+    """
+    def __init__(self, path: str, resume: dict = None):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume:
+            os.truncate(path, resume["bytes"])
+            self.file = open(path, "ab")
+            self.count, self.bytes = resume["count"], resume["bytes"]
+        else:
+            self.file = open(path, "wb")
+            self.count, self.bytes = 0, 0
+
+    def write(self, obj: dict):
+        line = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+        self.file.write(line)
+        self.file.flush()
+        self.count += 1
+        self.bytes += len(line)
+
+    def position(self) -> dict:
+        return {"count": self.count, "bytes": self.bytes}
+
+    def close(self):
+        self.file.close()
+
+def read_snapshot_stream(path: str):
+    """Objects of a snapshot stream; a last line cut off by a crash is skipped."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                print(f"Warning: Skipping truncated line in {path}", file=sys.stderr)
+
+def finalize_snapshot(result: dict, path: str) -> dict:
+    """Fill in the objects of a streamed run's result from its stream, sorted by price difference."""
+    result["objects"] = sorted(read_snapshot_stream(path), key=snapshot_sort_key)
+    result["meta"]["objectsFound"] = len(result["objects"])
+    return result
+
+def save_snapshot(result: dict, paths):
+    """Write the snapshot JSON to each path, serialized once and replaced atomically."""
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    for path in paths:
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+# =====================
+# CHECKPOINT
+# =====================
+# run() periodically saves everything needed to continue an interrupted crawl:
+# the URLs in flight, per-config pages and counters, seen IDs, and the objects
+# accepted so far (as a position in the snapshot stream when streaming).
+CHECKPOINT_VERSION = 1
+
+def save_checkpoint(path: str, checkpoint: dict):
+    """Write a crawl checkpoint, replacing the previous one atomically."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def load_checkpoint(path: str, start_urls, stream_path=None):
+    """The checkpoint at `path` if it was saved by the same crawl, otherwise None."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        print(f"No checkpoint at {path}; starting a new crawl.")
+        return None
+    except ValueError as e:
+        print(f"Warning: Unreadable checkpoint {path} ({e}); starting a new crawl.", file=sys.stderr)
+        return None
+
+    stream = checkpoint.get("stream")
+    if checkpoint.get("version") != CHECKPOINT_VERSION or checkpoint.get("startUrls") != [c["url"] for c in start_urls]:
+        print(f"Warning: Checkpoint {path} is from a different crawl; starting a new crawl.", file=sys.stderr)
+        return None
+    if (stream or {}).get("path") != stream_path or (stream and not os.path.exists(stream_path)):
+        print(f"Warning: Checkpoint {path} does not match the snapshot stream; starting a new crawl.", file=sys.stderr)
+        return None
+    return checkpoint
+
 # =====================
 # MAIN CRAWL
 # =====================
-def run(start_urls=SEARCH_URLS):
-    print(f"Starting crawl of {len(start_urls)} search configs...")
+# extract_objects and fetch as defined here; scripts like run_scrape_ekens.py wrap
+# them, and a wrapper only exists in the crawling process, so those runs parse inline.
+_builtin_extract_objects = extract_objects
+_builtin_fetch = fetch
+
+def paginate(page, url: str, pagination):
+    """Further page URLs of a fetched page and whether they were planned from its hit count.
+
+    `pagination` is "plan" for a config's first page, "links" to follow
+    pagination links and None when the config's pages are already planned.
+    """
+    new_pages = plan_pages(page, url) if pagination == "plan" else None
+    if new_pages is not None:
+        return new_pages, True
+    return (find_pages(page, url) if pagination else []), False
+
+def parse_page(page, url: str, pagination):
+    """Extract a fetched page's objects and further page URLs; runs in a parser worker.
+
+    Also returns the cache entry of a page fetched with deferred caching (None otherwise).
+    """
+    entry = None
+    if "pendingCache" in page:
+        entry = page_entry(url, page["status"], page["html"])
+        entry["fetchedAt"] = page["fetchedAt"]
+        page = entry
+    return (extract_objects(page, url), *paginate(page, url, pagination), entry)
+
+def run(start_urls=SEARCH_URLS, reparse=False, stream_path=None, checkpoint_path=None, resume=False):
+    """Crawl the search configs and return the snapshot.
+
+    With `reparse`, pages come only from the cache (any age, no network or
+    delays) and every page is extracted again. With `stream_path`, accepted
+    objects go to that JSON Lines file instead of memory and the returned
+    snapshot has no "objects" until finalize_snapshot() fills them in.
+    With `checkpoint_path`, the crawl state is saved there periodically, and
+    `resume` continues from it.
+    """
+    if reparse:
+        print(f"Re-parsing cached pages of {len(start_urls)} search configs...")
+    else:
+        print(f"Starting crawl of {len(start_urls)} search configs...")
+    fetch_page = fetch_cached if reparse else fetch
     
     # Load existing objects to avoid re-fetching detail pages and save API calls
     existing_data = {}
@@ -1186,102 +2542,292 @@ def run(start_urls=SEARCH_URLS):
     except Exception as e:
         print(f"Failed to load existing data for deduplication: {e}", file=sys.stderr)
         
+    resumed = load_checkpoint(checkpoint_path, start_urls, stream_path) if resume and checkpoint_path else None
+
     all_objects = []
+    stream = SnapshotStream(stream_path, resume=resumed and resumed["stream"]) if stream_path else None
     pages_crawled = 0
+    cache_hits = 0
     
     # Track unique IDs to avoid duplicates across searches
     seen_ids = set()
 
-    for search_config in start_urls:
-        start_url = search_config["url"]
-        city = search_config["city"]
-        
-        queue = [start_url]
-        seen_pages = {start_url}
-        pages_this_config = 0
-        
-        while queue and (not MAX_PAGES_PER_SEARCH or pages_this_config < MAX_PAGES_PER_SEARCH):
-            url = queue.pop(0)
-            pages_this_config += 1
-            
-            # Graceful delay before fetch
-            if pages_crawled > 0:
-                d = DELAY_SECONDS * (0.8 + 0.4 * random.random())
-                time.sleep(d)
+    def accept(state, new_objects):
+        city = state["city"]
+        for obj in new_objects:
+            if obj["booliId"] not in seen_ids:
+                seen_ids.add(obj["booliId"])
+                
+                if "Toppvåning" in (obj.get("tags") or []) and city == "Uppsala":
+                    obj["searchSource"] = f"{city} (top floor)"
+                else:
+                    obj["searchSource"] = city
+                state["sources"].add(obj["searchSource"])
+
+                # We don't fetch detail pages anymore. Just use existing data or fallback.
+                existing_obj = existing_data.get(obj["url"])
+                if existing_obj and existing_obj.get("operatingCost") is not None:
+                    # Reusing existing data
+                    for key in ["operatingCost"]:
+                        if existing_obj.get(key) is not None and obj.get(key) is None:
+                            obj[key] = existing_obj[key]
+
+                if stream is not None:
+                    stream.write(obj)
+                else:
+                    all_objects.append(obj)
+
+    # Per-config crawl state. Pages are fetched concurrently, but extracted objects
+    # are merged in config order afterwards so dedup and searchSource stay deterministic.
+    configs = [
+        {"city": c["city"], "start_url": c["url"], "seen_pages": {c["url"]}, "scheduled": 0, "planned": False, "results": [],
+         "failed": 0, "sources": set()}
+        for c in start_urls
+    ]
+    # Configs before this one have all their pages merged and their objects accepted
+    next_config = 0
+    # Configs before this one have been started
+    next_start = 0
+
+    if resumed:
+        pages_crawled, cache_hits, next_config = resumed["pagesCrawled"], resumed["cacheHits"], resumed["nextConfig"]
+        seen_ids.update(resumed["seenIds"])
+        all_objects.extend(resumed["objects"])
+        for state, saved in zip(configs, resumed["configs"]):
+            state.update(seen_pages=set(saved["seenPages"]), scheduled=saved["scheduled"], planned=saved["planned"], results=saved["results"],
+                         failed=saved.get("failed", 0), sources=set(saved.get("sources", [])))
+        next_start = max([next_config] + [i + 1 for i, state in enumerate(configs) if state["scheduled"]])
+        print(f"Resuming from checkpoint: {pages_crawled} pages crawled, {len(resumed['frontier'])} in flight, {len(seen_ids)} objects accepted.")
+
+    # Fetch threads hand pages to a pool of parser processes. At most
+    # PARSE_QUEUE_SIZE fetched pages wait for a parser; beyond that fetching pauses.
+    workers = PARSE_WORKERS if extract_objects is _builtin_extract_objects else 0
+    parse_slots = threading.BoundedSemaphore(max(1, PARSE_QUEUE_SIZE))
+    # Downloaded pages go to the parsers as raw HTML; reducing them to a cache entry is parser work
+    defer_cache = workers > 0 and fetch_page is _builtin_fetch
+
+    def fetch_for_parse(url):
+        parse_slots.acquire()
+        try:
+            if defer_cache:
+                return fetch_page(url, 2, defer_cache=True)
+            return fetch_page(url, 2)
+        except BaseException:
+            parse_slots.release()
+            raise
+
+    parsers = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) if workers > 0 else None
+    with ThreadPoolExecutor(max_workers=max(1, CRAWL_CONCURRENCY)) as pool:
+        pending = {}
+        parsing = {}
+
+        def schedule(idx, url):
+            configs[idx]["scheduled"] += 1
+            pending[pool.submit(fetch_for_parse, url)] = (idx, url)
+
+        last_checkpoint = time.monotonic()
+
+        def checkpoint():
+            nonlocal last_checkpoint
+            # Pages being fetched or parsed are fetched again on resume
+            frontier = list(pending.values()) + [entry[:2] for entry in parsing.values()]
+            save_checkpoint(checkpoint_path, {
+                "version": CHECKPOINT_VERSION,
+                "startUrls": [c["url"] for c in start_urls],
+                "pagesCrawled": pages_crawled,
+                "cacheHits": cache_hits,
+                "nextConfig": next_config,
+                "seenIds": list(seen_ids),
+                "stream": dict(path=stream.path, **stream.position()) if stream is not None else None,
+                "objects": all_objects,
+                "configs": [
+                    {"seenPages": sorted(state["seen_pages"]), "scheduled": state["scheduled"], "planned": state["planned"], "results": state["results"],
+                     "failed": state["failed"], "sources": sorted(state["sources"])}
+                    for state in configs
+                ],
+                "frontier": [[idx, url] for idx, url in frontier],
+            })
+            last_checkpoint = time.monotonic()
+
+        def merge(idx, url, page_data, cached, new_objects, new_pages, planned):
+            nonlocal pages_crawled, cache_hits
+            state = configs[idx]
+            if not new_objects:
+                html = page_data.get("html") or page_data.get("text") or ""
+                print(f"Warning: No objects extracted from {url}. Status: {page_data.get('status')}. HTML length: {page_data.get('htmlBytes', len(html))}")
+                # Log snippet of HTML for debugging if objects missing
+                if len(html) > 0:
+                    print(f"HTML snippet: {html[:200]}...")
+
+            print(f"Extracted {len(new_objects)} objects from {url}")
+            state["results"].append(new_objects)
+            pages_crawled += 1
+            cache_hits += bool(cached)
+
+            # A planned first page schedules every page of the search at once
+            if planned:
+                state["planned"] = True
+            for p in new_pages:
+                if p not in state["seen_pages"]:
+                    state["seen_pages"].add(p)
+                    if not MAX_PAGES_PER_SEARCH or state["scheduled"] < MAX_PAGES_PER_SEARCH:
+                        schedule(idx, p)
+
+            print(f"Processed {url} - found {len(new_objects)} objects, {len(new_pages)} new pages.")
+
+        def accept_ready():
+            # Objects of the first unfinished config can be accepted as they come;
+            # later configs wait until every config before them has finished
+            nonlocal next_config
+            active = {entry[0] for entry in pending.values()} | {entry[0] for entry in parsing.values()}
+            while next_config < next_start:
+                state = configs[next_config]
+                for new_objects in state["results"]:
+                    accept(state, new_objects)
+                state["results"].clear()
+                if next_config in active:
+                    break
+                next_config += 1
+
+        def start_configs():
+            # Keep CONFIGS_IN_FLIGHT configs going, counted from the first unfinished one
+            nonlocal next_start
+            limit = len(configs) if CONFIGS_IN_FLIGHT <= 0 else min(len(configs), next_config + CONFIGS_IN_FLIGHT)
+            while next_start < limit:
+                schedule(next_start, configs[next_start]["start_url"])
+                next_start += 1
+
+        if resumed:
+            for idx, url in resumed["frontier"]:
+                pending[pool.submit(fetch_for_parse, url)] = (idx, url)
+        start_configs()
+
+        while pending or parsing:
+            done, _ = wait(list(pending) + list(parsing), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in parsing:
+                    idx, url, page_data, cached, pagination = parsing.pop(future)
+                    parse_slots.release()
+                    try:
+                        try:
+                            new_objects, new_pages, planned, entry = future.result()
+                        except BrokenProcessPool as e:
+                            # A worker died (or could not start); parse the rest in this process
+                            if parsers is not None:
+                                print(f"Warning: Parser workers failed ({e}); parsing inline.", file=sys.stderr)
+                                parsers.shutdown(wait=False, cancel_futures=True)
+                                parsers = None
+                            new_objects, new_pages, planned, entry = parse_page(page_data, url, pagination)
+                        if entry is not None:
+                            cache_write(url, entry, headers=page_data["pendingCache"])
+                        cache_write_objects(url, new_objects)
+                        merge(idx, url, page_data, cached, new_objects, new_pages, planned)
+                    except Exception as e:
+                        print(f"Failed to process {url}: {e}", file=sys.stderr)
+                        configs[idx]["failed"] += 1
+                    continue
 
-            try:
-                page_data, cached = fetch(url, ttl_hours=2)
-                if not page_data:
-                    print(f"Warning: Fetch returned no data for {url}", file=sys.stderr)
+                idx, url = pending.pop(future)
+                state = configs[idx]
+                try:
+                    page_data, cached = future.result()
+                except Exception as e:
+                    print(f"Failed to process {url}: {e}", file=sys.stderr)
+                    state["failed"] += 1
                     continue
 
-                html = page_data.get("html", "")
-                
-                # Extract objects
-                new_objects = extract_objects(html, url)
-                if not new_objects:
-                    print(f"Warning: No objects extracted from {url}. Status: {page_data.get('status')}. HTML length: {len(html)}")
-                    # Log snippet of HTML for debugging if objects missing
-                    if len(html) > 0:
-                        print(f"HTML snippet: {html[:200]}...")
-
-                first_taken_this_config = False
-                print(f"Extracted {len(new_objects)} objects from {url}")
-                
-                for i, obj in enumerate(new_objects):
-                    if obj["booliId"] not in seen_ids:
-                        seen_ids.add(obj["booliId"])
-                        first_taken_this_config = True
-                        
-                        if "Toppvåning" in (obj.get("tags") or []) and city == "Uppsala":
-                            obj["searchSource"] = f"{city} (top floor)"
+                handed_off = False
+                try:
+                    if not page_data:
+                        if reparse:
+                            print(f"Warning: {url} is not cached; skipping.", file=sys.stderr)
                         else:
-                            obj["searchSource"] = city
-
-                        # We don't fetch detail pages anymore. Just use existing data or fallback.
-                        existing_obj = existing_data.get(obj["url"])
-                        if existing_obj and existing_obj.get("operatingCost") is not None:
-                            # Reusing existing data
-                            for key in ["operatingCost"]:
-                                if existing_obj.get(key) is not None and obj.get(key) is None:
-                                    obj[key] = existing_obj[key]
-                        
-
-                        all_objects.append(obj)
-                
-                pages_crawled += 1
-                
-                # Find next pages
-                new_pages = find_pages(html, url)
-                for p in new_pages:
-                    if p not in seen_pages:
-                        seen_pages.add(p)
-                        queue.append(p)
-
-                print(f"Processed {url} - found {len(new_objects)} objects, {len(new_pages)} new pages.")
-
-            except Exception as e:
-                print(f"Failed to process {url}: {e}", file=sys.stderr)
-
-    print(f"\nCrawl complete. Found {len(all_objects)} unique objects across {pages_crawled} pages.")
-
-    # Cleanup browser
-    close_browser()
-
-    return {
+                            print(f"Warning: Fetch returned no data for {url}", file=sys.stderr)
+                        state["failed"] += 1
+                        continue
+
+                    # Plan every page of the search from the first page's hit count, so
+                    # they can all be fetched at once; otherwise follow pagination links
+                    if state["planned"]:
+                        pagination = None
+                    else:
+                        pagination = "plan" if url == state["start_url"] else "links"
+
+                    # Reuse the objects stored with an unchanged cached body
+                    new_objects = cache_read_objects(url) if cached and not reparse else None
+                    if new_objects is None and parsers is not None:
+                        parsing[parsers.submit(parse_page, page_data, url, pagination)] = (idx, url, page_data, cached, pagination)
+                        handed_off = True
+                        continue
+
+                    if new_objects is None:
+                        new_objects, new_pages, planned, entry = parse_page(page_data, url, pagination)
+                        if entry is not None:
+                            cache_write(url, entry, headers=page_data["pendingCache"])
+                        cache_write_objects(url, new_objects)
+                    else:
+                        new_pages, planned = paginate(page_data, url, pagination)
+                    merge(idx, url, page_data, cached, new_objects, new_pages, planned)
+                except Exception as e:
+                    print(f"Failed to process {url}: {e}", file=sys.stderr)
+                    state["failed"] += 1
+                finally:
+                    if not handed_off:
+                        parse_slots.release()
+            accept_ready()
+            start_configs()
+            if checkpoint_path and time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL_SECONDS:
+                checkpoint()
+
+        # A crash while saving the snapshot resumes straight to the end
+        if checkpoint_path:
+            checkpoint()
+
+    if parsers is not None:
+        parsers.shutdown()
+    if stream is not None:
+        stream.close()
+    objects_found = stream.count if stream is not None else len(all_objects)
+
+    print(f"\nCrawl complete. Found {objects_found} unique objects across {pages_crawled} pages.")
+    # A listing missing from a search that lost pages may simply not have been fetched
+    incomplete = {state["city"] for state in configs if state["failed"]}
+    if incomplete:
+        print(f"Warning: Pages failed for {', '.join(sorted(incomplete))}; their listings are not checked for removal.", file=sys.stderr)
+    complete_sources = set().union(*(state["sources"] for state in configs if state["city"] not in incomplete))
+    if revalidation_stats["notModified"]:
+        print(
+            f"Revalidated {revalidation_stats['notModified']} pages with 304 Not Modified, "
+            f"saving {revalidation_stats['bytesSaved'] / 1024:.0f} KB and {revalidation_stats['creditsSaved']} proxy credits."
+        )
+
+    # A re-parse made no requests, so backend health and cache usage are unchanged
+    if not reparse:
+        print_provider_health()
+        save_provider_health()
+
+        gc_result = cache_gc()
+        if gc_result["evicted"] or gc_result["legacyRemoved"]:
+            print(f"Cache GC evicted {gc_result['evicted']} entries and {gc_result['legacyRemoved']} legacy files.")
+
+        # Cleanup browser
+        close_browser()
+
+    result = {
         "meta": {
             "crawledAt": datetime.now(timezone.utc).isoformat(),
             "pagesCrawled": pages_crawled,
-            "objectsFound": len(all_objects),
-            "cacheHitRatio": 0 
+            "objectsFound": objects_found,
+            "cacheHitRatio": round(cache_hits / pages_crawled, 3) if pages_crawled else 0,
+            "revalidation": dict(revalidation_stats),
+            # searchSources whose every page was fetched (see history.record_snapshot)
+            "completeSources": sorted(complete_sources)
         },
-        "objects": sorted(
-            all_objects,
-            key=lambda o: (o["priceDiff"] if o["priceDiff"] is not None else 10**12),
-            reverse=False
-        ),
         "errors": []
     }
+    if stream is None:
+        result["objects"] = sorted(all_objects, key=snapshot_sort_key)
+    return result
 
 # =====================
 # ENTRY
@@ -1292,8 +2838,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Booli Crawler")
     parser.add_argument("--url", default=None, help="Start URL for crawling (optional override)")
     parser.add_argument("--output", default="booli_daily_snapshot.json", help="Output JSON file")
+    parser.add_argument("--reparse", action="store_true", help="Rebuild the snapshot from cached pages only, without network or delays")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted crawl from its last checkpoint")
+    subparsers = parser.add_subparsers(dest="command")
+    cache_parser = subparsers.add_parser("cache", help="Inspect or maintain the page cache")
+    cache_parser.add_argument("action", choices=["stats", "gc", "verify"])
+    cache_parser.add_argument("--fix", action="store_true", help="With verify: remove broken entries and orphaned files")
     
     args = parser.parse_args()
+
+    if args.command == "cache":
+        sys.exit(cache_command(args.action, fix=args.fix))
     
     # Override global START_URL for the run function logic (or pass it in)
     # Better: refactor run() to accept url.
@@ -1308,7 +2863,12 @@ if __name__ == "__main__":
              # If manual URL passed, we don't know the city, default to Uppsala or 'Manual'
              urls_to_use = [{"city": "Manual", "url": args.url}]
              
-        result = run(start_urls=urls_to_use)
+        stream_path = SNAPSHOT_STREAM_PATH or None
+        checkpoint_path = CHECKPOINT_PATH or None
+        result = run(start_urls=urls_to_use, reparse=args.reparse, stream_path=stream_path,
+                     checkpoint_path=checkpoint_path, resume=args.resume)
+        if stream_path:
+            finalize_snapshot(result, stream_path)
         
         # Validate result before saving
         if not result or not result.get("objects"):
@@ -1318,7 +2878,7 @@ if __name__ == "__main__":
         snapshot_dir = "snapshots"
         os.makedirs(snapshot_dir, exist_ok=True)
         
-        # Delete old snapshots (keep only latest successful)
+        # Delete old snapshots (keep only latest successful); their prices live on in the listing history
         for old_file in glob.glob(os.path.join(snapshot_dir, "*.json")):
             try:
                 os.remove(old_file)
@@ -1327,18 +2887,23 @@ if __name__ == "__main__":
         date_str = datetime.now().strftime("%Y-%m-%d")
         snapshot_path = os.path.join(snapshot_dir, f"{date_str}.json")
         
-        with open(snapshot_path, "w", encoding="utf-8") as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
-            
-        # 2. Save to specified output (e.g. booli_daily_snapshot.json)
-        # Using a temp file + rename for atomicity
-        temp_output = args.output + ".tmp"
-        with open(temp_output, "w", encoding="utf-8") as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
-        
-        if os.path.exists(args.output):
-            os.remove(args.output)
-        os.rename(temp_output, args.output)
+        # 2. Also save to specified output (e.g. booli_daily_snapshot.json)
+        save_snapshot(result, [snapshot_path, args.output])
+
+        # 3. Record today's prices and statuses. A single --url crawl says nothing about the other
+        # searches, and a --reparse replays old cached pages, so neither is an observation of today
+        if not args.url and not args.reparse:
+            try:
+                recorded = history.record_snapshot(
+                    HISTORY_DB_PATH, result["objects"], result["meta"]["crawledAt"][:10], result["meta"]["completeSources"]
+                )
+                print(f"Recorded {recorded['written']} changed listings of {recorded['observed']} in {HISTORY_DB_PATH}")
+            except sqlite3.Error as e:
+                print(f"Warning: Could not update listing history: {e}", file=sys.stderr)
+
+        for done_path in (stream_path, checkpoint_path):
+            if done_path and os.path.exists(done_path):
+                os.remove(done_path)
 
         print(f"Successfully saved latest snapshot to {args.output} and {snapshot_path}")
         sys.exit(0)
@@ -35,6 +35,7 @@ import { db } from './firebase';
 // Utils
 import PullToRefresh from './components/PullToRefresh';
 import { formatLastUpdated } from './utils/formatters';
+import { expandListingData } from './utils/listingData';
 
 // Reset user settings on page reload
 if (typeof window !== 'undefined') {
@@ -148,7 +149,7 @@ function App() {
                 throw new Error(`Fetch failed: ${response.status} ${response.statusText}`);
             }
 
-            const liveData = await response.json();
+            const liveData = expandListingData(await response.json());
 
             if (liveData.objects && Array.isArray(liveData.objects) && liveData.objects.length > 0) {
                 // Data Validation
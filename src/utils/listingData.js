@@ -0,0 +1,37 @@
+/**
+ * Expand Booli CDN image ids of a v2 object back to full URLs
+ * @param {Object} obj
+ * @param {string} template - URL template with an {id} placeholder
+ * @returns {Object}
+ */
+const expandImages = (obj, template) => {
+    const toUrl = (value) => (typeof value === 'string' && /^\d+$/.test(value) ? template.replace('{id}', value) : value);
+    return {
+        ...obj,
+        imageUrl: toUrl(obj.imageUrl),
+        images: (obj.images || []).map(toUrl)
+    };
+};
+
+/**
+ * Normalize listing_data.json to the v1 shape (full objects everywhere).
+ * v2 files store each object once, with rankings and groups as indices into
+ * `objects` and images as ids; v1 files are returned unchanged.
+ * @param {Object} data - Parsed listing_data.json
+ * @returns {Object}
+ */
+export const expandListingData = (data) => {
+    if (!data || data.meta?.schemaVersion !== 2) return data;
+
+    const template = data.meta.imageUrlTemplate;
+    const objects = (data.objects || []).map(obj => (obj && typeof obj === 'object' ? expandImages(obj, template) : obj));
+    const deref = (indices) => indices.map(i => objects[i]);
+    const mapValues = (record, fn) => Object.fromEntries(Object.entries(record || {}).map(([key, value]) => [key, fn(value)]));
+
+    return {
+        ...data,
+        objects,
+        rankings: mapValues(data.rankings, deref),
+        groups: mapValues(data.groups, group => mapValues(group, deref))
+    };
+};
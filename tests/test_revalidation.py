@@ -0,0 +1,102 @@
+"""fetch() against a local server that honours ETag validators.
+
+Run with `python -m pytest tests` (or `python -m unittest discover tests`).
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# scraper.py reads its configuration at import: a throwaway cache, no proxies,
+# no Playwright and no rate limit for the local host
+CACHE_DIR = tempfile.mkdtemp(prefix="booli_cache_test_")
+os.environ.update({
+    "CACHE_DIR": CACHE_DIR,
+    "CACHE_MODE": "payload",
+    "USE_PLAYWRIGHT": "",
+    "PROXY_RATE_PER_SECOND": "0",
+    "SCRAPER_API_KEY": "",
+    "SCRAPINGBEE_API_KEY": "",
+    "ZENROWS_API_KEY": "",
+    "SCRAPINGANT_API_KEY": "",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scraper  # noqa: E402
+
+ETAG = '"listing-v1"'
+PAGE = (
+    "<html><body><h1>Bostäder till salu</h1>"
+    '<a href="/sok/till-salu?areaIds=1&page=2">2</a></body></html>'
+).encode("utf-8")
+
+
+def tearDownModule():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+class ValidatingHandler(BaseHTTPRequestHandler):
+    """Serves PAGE with an ETag and answers a matching If-None-Match with 304."""
+    served = []
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == ETAG:
+            self.served.append(304)
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+        self.served.append(200)
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+class RevalidationTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ValidatingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        ValidatingHandler.served = []
+        self.url = f"http://127.0.0.1:{self.server.server_port}/sok/till-salu?areaIds=1"
+        # The home-page visit would go to booli.se
+        self.warm_session = scraper.warm_session
+        scraper.warm_session = lambda session, profile: None
+
+    def tearDown(self):
+        scraper.warm_session = self.warm_session
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_expired_entry_is_revalidated_with_its_etag(self):
+        data, cached = scraper.fetch(self.url, 2)
+        self.assertFalse(cached)
+        self.assertEqual(ValidatingHandler.served, [200])
+        self.assertEqual(scraper.cache_lookup(self.url)["etag"], ETAG)
+
+        # Age the entry past its TTL so the next fetch has to ask the server
+        db = scraper.cache_db()
+        db.execute("UPDATE entries SET fetched_at = fetched_at - 86400 WHERE url = ?", (self.url,))
+        db.commit()
+        self.assertFalse(scraper.cache_valid(self.url, 2))
+
+        saved_before = scraper.revalidation_stats["bytesSaved"]
+        revalidated, cached = scraper.fetch(self.url, 2)
+        self.assertTrue(cached)
+        self.assertEqual(ValidatingHandler.served, [200, 304])
+        self.assertEqual(revalidated["text"], data["text"])
+        self.assertEqual(scraper.revalidation_stats["bytesSaved"] - saved_before, len(PAGE))
+        # The 304 renewed the entry
+        self.assertTrue(scraper.cache_valid(self.url, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
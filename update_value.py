@@ -1,24 +1,32 @@
-import json
+from analyze import HISTORY_FILE, dataset_version, decode_listing_data, load_json, public_output, write_listing_data
 
-file_path = 'src/listing_data.json'
-with open(file_path, 'r', encoding='utf-8') as f:
-    data = json.load(f)
+stored = load_json(HISTORY_FILE)
+# Keep the schema the file was written in; edits are made in the v1 shape
+schema_version = stored.get('meta', {}).get('schemaVersion', 1)
+data = decode_listing_data(stored)
 
-for obj in data['objects']:
+def update(obj):
+    obj['estimatedValue'] = 3530000
+    obj['priceDiff'] = obj['listPrice'] - obj['estimatedValue']
+    if obj['estimatedValue'] > 0:
+        obj['priceDiffPercent'] = round((obj['priceDiff'] / obj['estimatedValue']) * 100, 2)
+
+# A v1 file holds copies of the object in its rankings and groups
+records = data['objects'] + [obj for items in data['rankings'].values() for obj in items]
+records += [obj for group in data['groups'].values() for items in group.values() for obj in items]
+for obj in records:
     if obj.get('address') == 'Kryddblandargatan 5':
-        obj['estimatedValue'] = 3530000
-        obj['priceDiff'] = obj['listPrice'] - obj['estimatedValue']
-        if obj['estimatedValue'] > 0:
-            obj['priceDiffPercent'] = round((obj['priceDiff'] / obj['estimatedValue']) * 100, 2)
-        break
+        update(obj)
+
+best_deals = data['rankings'].get('bestDealsByDiff', [])
+best_deals.sort(key=lambda x: x['priceDiff'] if x.get('priceDiff') is not None else float('inf'))
+data['meta']['datasetVersion'] = dataset_version(data)
 
-with open(file_path, 'w', encoding='utf-8') as f:
-    json.dump(data, f, ensure_ascii=False, indent=2)
+write_listing_data(HISTORY_FILE, data, schema_version)
 
 public_path = 'public/listing_data.json'
 try:
-    with open(public_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    write_listing_data(public_path, public_output(data), schema_version)
 except FileNotFoundError:
     pass
 